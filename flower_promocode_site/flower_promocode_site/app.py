@@ -1,25 +1,57 @@
-from fastapi import FastAPI, Request, Form, HTTPException, Query
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from fastapi import FastAPI, Request, Form, HTTPException, Query, Depends
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+import asyncio
+import hashlib
 import os
 import uuid
 from datetime import datetime, timedelta
 import random
+import time
 from typing import Optional, List
+from urllib.parse import urlencode
+
+from assets import HashedStaticFiles
+from compression import CompressionMiddleware
+from counters import CounterAggregator
+from expiry import ExpiryScheduler
+from facets import DISCOUNT_BUCKETS, bucket_label, bucket_range
+from metrics import (PAGE_CACHE_REQUESTS, RECOMMEND_CACHE_REQUESTS, STARTUP_TIME, TRACK_EVENTS, Gauge,
+                     InstrumentedTemplates, MetricsMiddleware, record_render, registry)
+from pagecache import PageCache
+from pagination import MAX_PAGE_SIZE, PAGE_SIZE, decode_cursor, paginate
+from profiler import ProfilerMiddleware
+from ratelimit import RateLimitMiddleware, charge, parse_limits
+from promos import (ACTION_KEYS, EXPIRES_AT_FORMAT, FLOWER_TYPES, detect_discount_type, extract_discount_value,
+                    popularity_score)
+from recommend import Recommender
+from repository import create_repository
+from serializers import dumps, parse_fields, project
+from startup import StartupTimer, precompile_templates, warm_routes
+from streaming import FLUSH_MARKER, render_chunks
+
+# Этапы запуска для отчёта (точка отсчёта - конец импорта зависимостей)
+startup_timer = StartupTimer()
 
 app = FastAPI(title="🌸 Цветочные Промокоды", description="Самые выгодные скидки на цветы!")
+# Время запросов по маршрутам, отдельно время рендеринга шаблонов (/metrics)
+app.add_middleware(MetricsMiddleware)
 
-# Монтируем статические файлы
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Монтируем статические файлы (адреса с хешем содержимого кешируются навсегда)
+static_files = HashedStaticFiles(directory="static")
+app.mount("/static", static_files, name="static")
 
-# Создаем папки
-os.makedirs("templates", exist_ok=True)
-os.makedirs("static/css", exist_ok=True)
-os.makedirs("static/images", exist_ok=True)
+# В production шаблоны не проверяются на изменение файла при каждом рендеринге
+PRODUCTION = os.environ.get("PROMO_ENV", "development") == "production"
 
-# Шаблоны
-templates = Jinja2Templates(directory="templates")
+# Шаблоны (рендеринг каждого замеряется для /metrics)
+templates = InstrumentedTemplates(directory="templates")
+templates.env.globals["static_url"] = static_files.url
+templates.env.auto_reload = not PRODUCTION
+# Те же шаблоны в асинхронном режиме для потоковой отдачи (generate_async)
+stream_env = templates.env.overlay(enable_async=True)
+# Большие страницы отдаются порциями по мере рендеринга; 0 - целиком, как раньше
+STREAM_TEMPLATES = os.environ.get("PROMO_STREAM_TEMPLATES", "1") != "0"
 
 # Цветочная палитра
 FLOWER_COLORS = {
@@ -29,19 +61,33 @@ FLOWER_COLORS = {
     "hydrangea": "#7B68EE", "daisy": "#FFFACD", "iris": "#5D478B"
 }
 
-# Типы цветов с иконками
-FLOWER_TYPES = {
-    "Розы": "🌹", "Тюльпаны": "🌷", "Лилии": "⚜️",
-    "Хризантемы": "🌼", "Пионы": "🌸", "Орхидеи": "💮",
-    "Герберы": "🌻", "Альстромерии": "🏵️", "Подсолнухи": "🌻",
-    "Гортензии": "🔮", "Ирисы": "🔷", "Разные": "💐"
-}
-
-# Хранилище данных
-users_db = {}
-promocodes_db = []
-next_promo_id = 1
-popularity_stats = {}  # Статистика популярности промокодов
+# Хранилище данных: memory (один процесс) или sqlite (несколько воркеров)
+DATA_DIR = os.environ.get("PROMO_DATA_DIR", "data")
+STORAGE_BACKEND = os.environ.get("PROMO_STORAGE", "memory")
+CHECKPOINT_INTERVAL = 30  # секунд между сжатиями журнала
+# Секунд между сбросами счётчиков трекинга в хранилище; 0 - писать сразу
+TRACK_FLUSH_INTERVAL = float(os.environ.get("PROMO_TRACK_FLUSH_INTERVAL", "1"))
+repo = create_repository(STORAGE_BACKEND, DATA_DIR)
+# Секунд, на которые страницы со счётчиками популярности (рейтинг, поиск) могут от них отставать
+POPULARITY_TTL = float(os.environ.get("PROMO_POPULARITY_TTL", "30"))
+# Готовые страницы; версия растёт при каждом изменении каталога (у SQLite - общая для всех воркеров).
+# Сброс счётчиков её не меняет: иначе кеш очищался бы раз в TRACK_FLUSH_INTERVAL
+page_cache = PageCache(int(os.environ.get("PROMO_PAGE_CACHE_SIZE", "256")), shared_version=repo.data_version,
+                       popularity_ttl=POPULARITY_TTL)
+counters = CounterAggregator(repo, TRACK_FLUSH_INTERVAL)
+# Секунд между фоновыми пересчётами матрицы сходства для рекомендаций
+RECOMMEND_INTERVAL = float(os.environ.get("PROMO_RECOMMEND_INTERVAL", "10"))
+recommender = Recommender(os.path.join(DATA_DIR, "interactions.json"), repo=repo)
+# Профиль отдельного запроса: администратор добавляет к адресу _profile=1.
+# Проверка - cookie username, как и везде на сайте; число и частота профилей ограничены
+app.add_middleware(ProfilerMiddleware, profiles_dir=os.path.join(DATA_DIR, "profiles"))
+# Сжатие HTML по Accept-Encoding (brotli, если установлен, иначе gzip); страницы короче
+# compression.MIN_SIZE отдаются как есть. Статика сжата заранее и проходит без изменений
+app.add_middleware(CompressionMiddleware)
+# Частота трекинга, подсказок поиска, добавления промокодов и регистрации с одного адреса (ответ 429).
+# PROMO_RATE_LIMITS="track=5:20,register=off": токенов в секунду:корзина, "off" - без ограничений.
+# Прослойка добавлена последней, поэтому выполняется первой - до метрик и маршрутизации
+app.add_middleware(RateLimitMiddleware, limits=parse_limits(os.environ.get("PROMO_RATE_LIMITS")))
 
 
 # Вспомогательные функции
@@ -75,194 +121,433 @@ def get_flower_quote():
     return random.choice(quotes)
 
 
-def extract_discount_value(discount_str: str) -> int:
-    """Извлекает числовое значение скидки из строки"""
-    import re
-    # Ищем числа в строке
-    numbers = re.findall(r'\d+', discount_str)
-    if numbers:
-        return int(numbers[0])
-    return 0
+# Случайные части страниц подставляются в готовый HTML при каждой отдаче
+FLOWER_QUOTE = page_cache.placeholder("flower_quote", get_flower_quote)
+RANDOM_EMOJI = page_cache.placeholder("random_emoji", get_random_flower_emoji)
+RANDOM_COLOR = page_cache.placeholder("random_color", get_random_color)
+
+
+# Своя версия данных считается с нуля при каждом запуске, поэтому в ETag входит и метка запуска
+BOOT_ID = uuid.uuid4().hex[:8]
+
+
+def page_etag(request: Request, username: Optional[str], popular: bool = False) -> str:
+    """ETag страницы: версия данных, адрес с параметрами и пользователь.
+
+    Общая версия из базы (SQLite) одна у всех воркеров и переживает
+    перезапуск, поэтому метка запуска с ней не нужна. Страницы со
+    счётчиками популярности (popular) добавляют номер интервала
+    POPULARITY_TTL, как и ключ в кеше страниц.
+    """
+    shared = repo.data_version()
+    version = f"{BOOT_ID}:{page_cache.local_version}" if shared is None else shared
+    if popular:
+        version = f"{version}:{page_cache.popularity_version}"
+    raw = f"{version}:{request.url.path}?{request.url.query}:{username or ''}"
+    return 'W/"' + hashlib.md5(raw.encode()).hexdigest() + '"'
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """Ответ 304, если у браузера уже есть эта версия страницы"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    # no-cache: браузер хранит страницу, но каждый раз сверяет ETag
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 
-def update_popularity(promo_id: int, action: str):
+def stream_template(request: Request, template_name: str, context: dict, on_complete=None,
+                    headers: Optional[dict] = None) -> Response:
+    """Страница, которая уходит клиенту порциями по мере рендеринга.
+
+    Шапка и навигация (до метки <!--flush--> в шаблоне) отправляются
+    сразу, карточки - следом порциями. on_complete получает всю страницу
+    в байтах, если рендеринг дошёл до конца (для кеша страниц).
+    """
+    context["request"] = request
+    if not STREAM_TEMPLATES:
+        body = templates.render(template_name, context).replace(FLUSH_MARKER, "").encode()
+        if on_complete:
+            on_complete(body)
+        return HTMLResponse(page_cache.fill(body), headers=headers)
+
+    async def body():
+        chunks = []
+        render_time = 0.0
+        started = time.perf_counter()
+        async for chunk in render_chunks(stream_env.get_template(template_name), context):
+            chunk = chunk.encode()
+            if on_complete:
+                chunks.append(chunk)
+            render_time += time.perf_counter() - started
+            yield page_cache.fill(chunk)
+            started = time.perf_counter()
+        record_render(request, template_name, render_time + time.perf_counter() - started)
+        if on_complete:
+            on_complete(b"".join(chunks))
+
+    return StreamingResponse(body(), media_type="text/html", headers=headers)
+
+
+def render_cached(request: Request, template_name: str, username: Optional[str],
+                  build_context, versioned: bool = True, popular: bool = False) -> Response:
+    """Отдаёт страницу из кеша или рендерит её потоком и кладёт в кеш.
+
+    Ключ - адрес с параметрами, пользователь и версия данных (для
+    страниц без данных из хранилища версия не нужна). popular - страница
+    показывает счётчики популярности и живёт не дольше POPULARITY_TTL.
+    """
+    version = page_cache.version if versioned else None
+    if popular:
+        version = (version, page_cache.popularity_version)
+    key = (request.url.path, request.url.query, username, version)
+    body = page_cache.get(key)
+    if body is not None:
+        PAGE_CACHE_REQUESTS.inc(template_name, "hit")
+        return HTMLResponse(page_cache.fill(body), headers={"X-Cache": "HIT"})
+
+    PAGE_CACHE_REQUESTS.inc(template_name, "miss")
+    context = build_context()
+    context["username"] = username
+    return stream_template(request, template_name, context, lambda body: page_cache.put(key, body),
+                           headers={"X-Cache": "MISS"})
+
+
+def update_popularity(promo_id: int, action: str, username: Optional[str] = None):
     """Обновляет статистику популярности промокода"""
-    if promo_id not in popularity_stats:
-        popularity_stats[promo_id] = {"views": 0, "copies": 0, "clicks": 0}
+    key = ACTION_KEYS.get(action)
+    if key:
+        counters.add(promo_id, key)
+        TRACK_EVENTS.inc(key)
+        if username and repo.get_promo(promo_id):
+            recommender.record(username, promo_id, key)
+
+
+def update_popularity_batch(events, username: Optional[str] = None) -> int:
+    """Ставит в очередь пачку событий трекинга; возвращает число принятых.
+
+    Принимаются события с известным действием по существующим промокодам -
+    остальные хранилище всё равно отбросило бы при сбросе счётчиков.
+    """
+    known = repo.existing_ids(event.promo_id for event in events)
+    deltas = [(event.promo_id, ACTION_KEYS[event.action], event.count)
+              for event in events if event.action in ACTION_KEYS and event.promo_id in known]
+    counters.add_many(deltas)
+    for _, key, n in deltas:
+        TRACK_EVENTS.inc(key, n=n)
+    if username:
+        for promo_id, key, n in deltas:
+            recommender.record(username, promo_id, key, n)
+    return len(deltas)
+
+
+# ========== ЗАГРУЗКА И СОХРАНЕНИЕ ДАННЫХ ==========
+async def checkpoint_loop():
+    """Периодически сжимает журнал хранилища"""
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        repo.checkpoint()
+        recommender.save()
+
+
+def expire_promo(promo_id: int):
+    """Срок действия вышел: промокод пропадает из каталога, поиска и рейтинга"""
+    repo.update_promo(promo_id, {"is_active": False})
+    recommender.invalidate()
+    page_cache.bump()
+
+
+def purge_promo(promo_id: int):
+    """Окончательное удаление истёкшего промокода после срока хранения"""
+    repo.delete_promo(promo_id)
+    recommender.forget_promo(promo_id)
+    page_cache.bump()
+
+
+# Через сколько дней после истечения удалять промокод совсем; не задано - не удалять
+PURGE_AFTER_DAYS = os.environ.get("PROMO_PURGE_AFTER_DAYS")
+# У SQLite сроки общие: каждый проход читает их из базы, и промокод любого воркера
+# истекает у того, кто проснётся первым
+expiry = ExpiryScheduler(expire_promo, purge_promo,
+                         float(PURGE_AFTER_DAYS) * 86400 if PURGE_AFTER_DAYS else None,
+                         shared=repo.expiry_due)
+
+
+def schedule_expiry(promo: dict):
+    expiry.schedule(promo["id"], promo.get("expires_at"), promo.get("is_active", True))
+
+
+# Байткод шаблонов между запусками; страницы, которые прогреваются перед приёмом запросов
+TEMPLATE_CACHE_DIR = os.path.join(DATA_DIR, "template_cache")
+WARM_ROUTES = ("/", "/search", "/rating")
+
+
+@app.on_event("startup")
+async def load_data():
+    startup_timer.lap("module")
+    with startup_timer.phase("templates"):
+        precompile_templates(templates.env, os.path.join(TEMPLATE_CACHE_DIR, "sync"))
+        precompile_templates(stream_env, os.path.join(TEMPLATE_CACHE_DIR, "async"))
+    with startup_timer.phase("assets"):
+        static_files.precompress()
+    with startup_timer.phase("storage"):
+        repo.open()
+    with startup_timer.phase("expiry"):
+        # Общее хранилище планировщик опрашивает сам - весь каталог в кучу нужен только памяти
+        if repo.data_version() is None:
+            for promo_id, expires_at, is_active in repo.expiry_schedule():
+                expiry.schedule(promo_id, expires_at, is_active)
+    with startup_timer.phase("recommender"):
+        recommender.load()
+    counters.start()
+    app.state.expiry_task = asyncio.create_task(expiry.run())
+    app.state.checkpoint_task = asyncio.create_task(checkpoint_loop())
+    app.state.recommend_task = asyncio.create_task(recommender.run(RECOMMEND_INTERVAL))
+    with startup_timer.phase("warmup"):
+        await warm_routes(app, WARM_ROUTES)
+    for phase, seconds in startup_timer.phases.items():
+        STARTUP_TIME.set(seconds, phase)
+    print(startup_timer.report())
+
+
+@app.on_event("shutdown")
+async def save_data():
+    app.state.checkpoint_task.cancel()
+    app.state.recommend_task.cancel()
+    app.state.expiry_task.cancel()
+    await counters.stop()
+    recommender.save()
+    repo.close()
+
+
+def get_page(fetch, order: str, cursor: Optional[str], limit: int):
+    """Страница списка и курсор следующей; испорченный курсор - ошибка 400"""
+    try:
+        return paginate(fetch, repo.position, order, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def next_page_url(request: Request, listing: str, next_cursor: Optional[str], **extra):
+    """Адрес HTML-фрагмента со следующей страницей списка"""
+    if not next_cursor:
+        return None
+    params = dict(request.query_params)
+    params.update(extra, cursor=next_cursor)
+    return f"/fragment/{listing}?{urlencode(params)}"
+
+
+def fragment_response(request: Request, template_name: str, context: dict, next_url: Optional[str]):
+    """Отдаёт только карточки страницы; адрес следующей - в заголовке X-Next-Page"""
+    response = templates.TemplateResponse(template_name, {"request": request, **context})
+    if next_url:
+        response.headers["X-Next-Page"] = next_url
+    return response
+
+
+class SearchParams:
+    """Параметры фильтрации и сортировки поиска"""
+
+    def __init__(self,
+                 query: Optional[str] = Query(None),
+                 flower_type: Optional[str] = Query(None),
+                 min_discount: Optional[int] = Query(None),
+                 max_discount: Optional[int] = Query(None),
+                 sort_by: str = Query("newest"),
+                 shop: Optional[str] = Query(None)):
+        self.query = query
+        self.flower_type = flower_type
+        self.min_discount = min_discount
+        self.max_discount = max_discount
+        self.sort_by = sort_by
+        self.shop = shop
+
+    def fetch(self, after, limit):
+        return repo.search(self.query, self.flower_type, self.shop, self.min_discount,
+                           self.max_discount, self.sort_by, after=after, limit=limit)
+
+    def fetch_with_facets(self, after, limit):
+        """Страница поиска; фасеты по тем же фильтрам остаются в self.facets"""
+        promos, self.facets = repo.faceted_search(self.query, self.flower_type, self.shop, self.min_discount,
+                                                  self.max_discount, self.sort_by, after=after, limit=limit)
+        return promos
+
+
+# Подсказки строки поиска и "Возможно, вы искали" при пустом результате
+SUGGEST_LIMIT = 8
+SUGGEST_MAX_LIMIT = 50
+DID_YOU_MEAN_LIMIT = 5
+
+# Названия типов скидки для фасетов поиска
+DISCOUNT_TYPE_NAMES = {"percentage": "Процент", "fixed": "Рубли", "other": "Другое"}
+
+
+def discount_facet(counts: dict) -> list:
+    """Корзины скидки по порядку: подпись, границы фильтра и число промокодов"""
+    return [
+        {"label": bucket_label(bucket), "low": bucket_range(bucket)[0], "high": bucket_range(bucket)[1],
+         "count": counts.get(bucket, 0)}
+        for bucket in range(len(DISCOUNT_BUCKETS) + 1)
+    ]
+
 
-    if action == "view":
-        popularity_stats[promo_id]["views"] += 1
-    elif action == "copy":
-        popularity_stats[promo_id]["copies"] += 1
-    elif action == "click":
-        popularity_stats[promo_id]["clicks"] += 1
+def filter_url(request: Request, **changes) -> str:
+    """Адрес поиска с изменёнными фильтрами (пустые значения убираются, курсор сбрасывается)"""
+    params = {key: value for key, value in request.query_params.items() if key != "cursor"}
+    params.update(changes)
+    return "/search?" + urlencode({key: value for key, value in params.items() if value not in (None, "")})
 
 
 def get_popular_promocodes(limit: int = 5):
     """Возвращает самые популярные промокоды"""
-    sorted_promos = sorted(
-        [(promo, popularity_stats.get(promo["id"], {"copies": 0, "views": 0}))
-         for promo in promocodes_db],
-        key=lambda x: (x[1]["copies"] * 3 + x[1]["views"] * 2 + x[1].get("clicks", 0)),
-        reverse=True
-    )
-    return [promo for promo, _ in sorted_promos[:limit]]
+    return repo.top_popular(limit)
 
 
 def get_recommendations(username: str, limit: int = 3):
     """Рекомендации на основе истории пользователя"""
-    user_promos = [p for p in promocodes_db if p["owner"] == username]
-    if not user_promos:
-        return get_popular_promocodes(limit)
-
-    # Находим предпочитаемые типы цветов пользователя
-    user_flower_types = {}
-    for promo in user_promos:
-        flower_type = promo.get("flower_type", "Разные")
-        user_flower_types[flower_type] = user_flower_types.get(flower_type, 0) + 1
+    ids = recommender.cached(username, limit)
+    RECOMMEND_CACHE_REQUESTS.inc("miss" if ids is None else "hit")
+    if ids is None:
+        # Свои промокоды не рекомендуем
+        own = {p["id"] for p in repo.promos_by_owner(username)}
+        ids = recommender.similar(username, limit, own)
 
-    # Рекомендуем промокоды с похожими типами цветов
-    preferred_types = [t for t, _ in sorted(user_flower_types.items(), key=lambda x: x[1], reverse=True)[:2]]
+        if len(ids) < limit:
+            # Добавляем популярные промокоды, если рекомендаций мало
+            seen = own.union(ids, recommender.interactions.get(username, ()))
+            popular = get_popular_promocodes(limit + len(seen))
+            ids += [p["id"] for p in popular if p["id"] not in seen][:limit - len(ids)]
 
-    recommendations = []
-    for promo in promocodes_db:
-        if promo["owner"] != username and promo.get("flower_type") in preferred_types:
-            recommendations.append(promo)
+        recommender.store(username, limit, ids)
 
-    if len(recommendations) < limit:
-        # Добавляем популярные промокоды, если рекомендаций мало
-        popular = get_popular_promocodes(limit - len(recommendations))
-        recommendations.extend([p for p in popular if p not in recommendations])
-
-    return recommendations[:limit]
+    return [promo for promo in map(repo.get_promo, ids) if promo is not None and promo.get("is_active", True)]
 
 
 # ========== ГЛАВНАЯ СТРАНИЦА ==========
 @app.get("/")
-async def home(request: Request):
+async def home(request: Request,
+               cursor: Optional[str] = Query(None),
+               limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
     username = get_current_user(request)
+    etag = page_etag(request, username)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
+    def build_context():
+        promocodes, next_cursor = get_page(repo.list_promos, "id", cursor, limit)
+
+        # Статистика
+        stats = {
+            "total_promos": repo.count_promos(),
+            "active_users": repo.count_users(),
+            "flower_quotes": FLOWER_QUOTE,
+            "random_emoji": RANDOM_EMOJI,
+            "popular_promos": get_popular_promocodes(3)
+        }
 
-    # Статистика
-    stats = {
-        "total_promos": len(promocodes_db),
-        "active_users": len(users_db),
-        "flower_quotes": get_flower_quote(),
-        "random_emoji": get_random_flower_emoji(),
-        "popular_promos": get_popular_promocodes(3)
-    }
+        return {
+            "promocodes": promocodes,
+            "next_page": next_page_url(request, "home", next_cursor),
+            "is_owner": lambda promo: is_owner(promo, username),
+            "stats": stats,
+            "colors": FLOWER_COLORS,
+            "flower_types": FLOWER_TYPES,
+            "random_color": RANDOM_COLOR
+        }
 
-    return templates.TemplateResponse("index.html", {
-        "request": request,
-        "username": username,
-        "promocodes": promocodes_db,
-        "is_owner": lambda promo: is_owner(promo, username),
-        "stats": stats,
-        "colors": FLOWER_COLORS,
-        "flower_types": FLOWER_TYPES,
-        "random_color": get_random_color()
-    })
+    return with_etag(render_cached(request, "index.html", username, build_context), etag)
 
 
 # ========== ПОИСК И ФИЛЬТРАЦИЯ ==========
 @app.get("/search")
 async def search_promocodes(
         request: Request,
-        query: Optional[str] = Query(None),
-        flower_type: Optional[str] = Query(None),
-        min_discount: Optional[int] = Query(None),
-        max_discount: Optional[int] = Query(None),
-        sort_by: str = Query("newest"),
-        shop: Optional[str] = Query(None)
+        params: SearchParams = Depends(),
+        cursor: Optional[str] = Query(None),
+        limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
 ):
     username = get_current_user(request)
+    # В карточках поиска - счётчики копирований, а sort_by=popular зависит от них целиком
+    etag = page_etag(request, username, popular=True)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
 
-    # Фильтрация промокодов
-    filtered = promocodes_db.copy()
-
-    # Поиск по тексту
-    if query:
-        query_lower = query.lower()
-        filtered = [
-            p for p in filtered
-            if (query_lower in p["code"].lower() or
-                query_lower in p["shop"].lower() or
-                query_lower in p.get("description", "").lower())
-        ]
+    filtered, next_cursor = get_page(params.fetch_with_facets, params.sort_by, cursor, limit)
+    # Пустой результат по тексту - вероятно опечатка: предлагаем близкие коды и магазины
+    did_you_mean = repo.suggest(params.query, DID_YOU_MEAN_LIMIT) if params.query and not filtered else []
 
-    # Фильтр по типу цветов
-    if flower_type and flower_type != "all":
-        filtered = [p for p in filtered if p.get("flower_type") == flower_type]
-
-    # Фильтр по магазину
-    if shop:
-        shop_lower = shop.lower()
-        filtered = [p for p in filtered if shop_lower in p["shop"].lower()]
-
-    # Фильтр по скидке
-    if min_discount is not None:
-        filtered = [p for p in filtered if extract_discount_value(p["discount"]) >= min_discount]
-
-    if max_discount is not None:
-        filtered = [p for p in filtered if extract_discount_value(p["discount"]) <= max_discount]
-
-    # Сортировка
-    if sort_by == "newest":
-        filtered.sort(key=lambda x: datetime.strptime(x["created_at"], "%d.%m.%Y %H:%M"), reverse=True)
-    elif sort_by == "oldest":
-        filtered.sort(key=lambda x: datetime.strptime(x["created_at"], "%d.%m.%Y %H:%M"))
-    elif sort_by == "discount_high":
-        filtered.sort(key=lambda x: extract_discount_value(x["discount"]), reverse=True)
-    elif sort_by == "discount_low":
-        filtered.sort(key=lambda x: extract_discount_value(x["discount"]))
-    elif sort_by == "popular":
-        filtered.sort(
-            key=lambda x: popularity_stats.get(x["id"], {"copies": 0})["copies"],
-            reverse=True
-        )
-
-    return templates.TemplateResponse("search.html", {
-        "request": request,
+    return with_etag(stream_template(request, "search.html", {
         "username": username,
+        "did_you_mean": did_you_mean,
+        "facets": params.facets,
+        "discount_facet": discount_facet(params.facets["discount"]),
+        "discount_type_names": DISCOUNT_TYPE_NAMES,
+        "filter_url": lambda **changes: filter_url(request, **changes),
         "promocodes": filtered,
-        "query": query,
-        "flower_type": flower_type,
-        "min_discount": min_discount,
-        "max_discount": max_discount,
-        "sort_by": sort_by,
-        "shop": shop,
+        "next_page": next_page_url(request, "search", next_cursor),
+        "get_stats": counters.get_stats,
+        "query": params.query,
+        "flower_type": params.flower_type,
+        "min_discount": params.min_discount,
+        "max_discount": params.max_discount,
+        "sort_by": params.sort_by,
+        "shop": params.shop,
         "colors": FLOWER_COLORS,
         "flower_types": FLOWER_TYPES,
         "is_owner": lambda promo: is_owner(promo, username)
-    })
+    }), etag)
+
+
+@app.get("/search/suggest")
+async def search_suggest(q: str = Query("", max_length=100),
+                         limit: int = Query(SUGGEST_LIMIT, ge=1, le=SUGGEST_MAX_LIMIT),
+                         fuzzy: bool = Query(True)):
+    """Автодополнение: коды и магазины по началу строки, при нехватке - с опечатками"""
+    return Response(dumps(repo.suggest(q, limit, fuzzy)), media_type="application/json")
 
 
 # ========== РЕЙТИНГ ПОПУЛЯРНОСТИ ==========
+def rating_fetch(after, limit):
+    return repo.top_popular(limit, after)
+
+
 @app.get("/rating")
-async def rating_page(request: Request):
+async def rating_page(request: Request,
+                      cursor: Optional[str] = Query(None),
+                      limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
     username = get_current_user(request)
+    etag = page_etag(request, username, popular=True)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
+    def build_context():
+        # Промокоды уже упорядочены по популярности, статистику шаблон берёт сам
+        promocodes, next_cursor = get_page(rating_fetch, "rating", cursor, limit)
+
+        return {
+            "promocodes": promocodes,
+            "start": 0,
+            "next_page": next_page_url(request, "rating", next_cursor, start=len(promocodes)),
+            "get_stats": counters.get_stats,
+            "popularity_score": popularity_score,
+            "colors": FLOWER_COLORS,
+            "flower_types": FLOWER_TYPES,
+            "is_owner": lambda promo: is_owner(promo, username)
+        }
 
-    # Получаем промокоды с их популярностью
-    promos_with_popularity = []
-    for promo in promocodes_db:
-        stats = popularity_stats.get(promo["id"], {"views": 0, "copies": 0, "clicks": 0})
-        score = stats["copies"] * 3 + stats["views"] * 2 + stats["clicks"]
-        promos_with_popularity.append({
-            **promo,
-            "popularity_score": score,
-            "stats": stats
-        })
-
-    # Сортируем по популярности
-    promos_with_popularity.sort(key=lambda x: x["popularity_score"], reverse=True)
-
-    return templates.TemplateResponse("rating.html", {
-        "request": request,
-        "username": username,
-        "promocodes": promos_with_popularity,
-        "colors": FLOWER_COLORS,
-        "flower_types": FLOWER_TYPES,
-        "is_owner": lambda promo: is_owner(promo, username)
-    })
+    return with_etag(render_cached(request, "rating.html", username, build_context, popular=True), etag)
 
 
 # ========== РЕКОМЕНДАЦИИ ==========
@@ -355,14 +640,12 @@ async def howto_page(request: Request):
         "💬 Делитесь своими промокодами - чем больше пользователей, тем больше скидок для всех"
     ]
 
-    return templates.TemplateResponse("howto.html", {
-        "request": request,
-        "username": username,
+    return render_cached(request, "howto.html", username, lambda: {
         "instructions": instructions,
         "money_saving_tips": money_saving_tips,
         "colors": FLOWER_COLORS,
         "flower_types": FLOWER_TYPES
-    })
+    }, versioned=False)
 
 
 # ========== ДОБАВЛЕНИЕ ПРОМОКОДА (обновлено для трекинга) ==========
@@ -378,27 +661,36 @@ async def add_promocode(request: Request,
     if not username:
         return RedirectResponse("/login", status_code=303)
 
-    global next_promo_id
-
-    # Определяем тип скидки
-    discount_type = "percentage" if "%" in discount else "fixed" if any(
-        word in discount.lower() for word in ["руб", "р.", "рублей"]) else "other"
+    error = discount_error(discount)
+    # Тот же код того же магазина уже в каталоге - второй раз не добавляем
+    duplicate = None if error else repo.find_duplicate(code, shop)
+    if duplicate is not None:
+        error = duplicate_error(duplicate)
+    if error:
+        return templates.TemplateResponse("add_promo.html", {
+            "request": request,
+            "username": username,
+            "error": error,
+            "duplicate": duplicate,
+            "form": {"code": code, "shop": shop, "discount": discount},
+            "colors": FLOWER_COLORS,
+            "flower_types": FLOWER_TYPES
+        })
 
     # Создаем промокод
     promocode = {
-        "id": next_promo_id,
         "code": code,
         "shop": shop,
         "discount": discount,
         "description": description or "",
         "usage_instructions": usage_instructions or "Скопируйте код и введите при оформлении заказа на сайте магазина",
         "flower_type": flower_type,
-        "discount_type": discount_type,
+        "discount_type": detect_discount_type(discount),
         "discount_value": extract_discount_value(discount),
         "owner": username,
         "owner_color": get_random_color(),
         "created_at": datetime.now().strftime("%d.%m.%Y %H:%M"),
-        "expires_at": (datetime.now() + timedelta(days=30)).strftime("%d.%m.%Y"),
+        "expires_at": (datetime.now() + timedelta(days=30)).strftime(EXPIRES_AT_FORMAT),
         "is_active": True,
         "views": 0,
         "copies": 0,
@@ -406,22 +698,239 @@ async def add_promocode(request: Request,
         "emoji": FLOWER_TYPES.get(flower_type, "💐")
     }
 
-    promocodes_db.append(promocode)
-    popularity_stats[next_promo_id] = {"views": 0, "copies": 0, "clicks": 0}
-    next_promo_id += 1
+    repo.add_promo(promocode)
+    schedule_expiry(promocode)
+    recommender.invalidate()
+    page_cache.bump()
+
+    return RedirectResponse("/", status_code=303)
+
+
+def duplicate_error(duplicate: dict) -> str:
+    return f"Промокод {duplicate['code']} для магазина «{duplicate['shop']}» уже есть в каталоге"
+
+
+# Наибольшая скидка, которую принимает форма (процентов или рублей)
+MAX_FORM_DISCOUNT = 1_000_000
+
+
+def discount_error(discount: str) -> Optional[str]:
+    if extract_discount_value(discount) > MAX_FORM_DISCOUNT:
+        return f"Скидка не может быть больше {MAX_FORM_DISCOUNT:,}".replace(",", " ")
+    return None
+
+
+# ========== РЕДАКТИРОВАНИЕ ==========
+@app.get("/edit_promo/{promo_id}")
+async def edit_promo_page(request: Request, promo_id: int):
+    username = get_current_user(request)
+    if not username:
+        return RedirectResponse("/login", status_code=303)
+
+    promocode = repo.get_promo(promo_id)
+    if not promocode:
+        raise HTTPException(status_code=404, detail="Промокод не найден")
+
+    if not is_owner(promocode, username):
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "error": "У вас нет прав для редактирования этого промокода",
+            "colors": FLOWER_COLORS
+        })
+
+    return templates.TemplateResponse("edit_promo.html", {
+        "request": request,
+        "username": username,
+        "promocode": promocode,
+        "colors": FLOWER_COLORS
+    })
+
+
+@app.post("/edit_promo/{promo_id}")
+async def edit_promocode(request: Request, promo_id: int,
+                         code: str = Form(...),
+                         shop: str = Form(...),
+                         discount: str = Form(...),
+                         description: str = Form(None)):
+    username = get_current_user(request)
+    if not username:
+        return RedirectResponse("/login", status_code=303)
+
+    promocode = repo.get_promo(promo_id)
+    if not promocode:
+        raise HTTPException(status_code=404, detail="Промокод не найден")
+
+    if not is_owner(promocode, username):
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "error": "У вас нет прав для редактирования этого промокода",
+            "colors": FLOWER_COLORS
+        })
+
+    fields = {
+        "code": code,
+        "shop": shop,
+        "discount": discount,
+        "description": description or "",
+        "discount_type": detect_discount_type(discount),
+        "discount_value": extract_discount_value(discount)
+    }
+    error = discount_error(discount)
+    duplicate = repo.find_duplicate(code, shop, exclude_id=promo_id) if promocode["is_active"] and not error else None
+    if duplicate is not None:
+        error = duplicate_error(duplicate)
+    if error:
+        return templates.TemplateResponse("edit_promo.html", {
+            "request": request,
+            "username": username,
+            "promocode": {**promocode, **fields},
+            "error": error,
+            "duplicate": duplicate,
+            "colors": FLOWER_COLORS
+        })
+
+    repo.update_promo(promo_id, fields)
+    recommender.invalidate()
+    page_cache.bump()
+
+    return RedirectResponse("/", status_code=303)
+
+
+# ========== УДАЛЕНИЕ ==========
+@app.get("/delete_promo/{promo_id}")
+async def delete_promocode(request: Request, promo_id: int):
+    username = get_current_user(request)
+    if not username:
+        return RedirectResponse("/login", status_code=303)
+
+    promocode = repo.get_promo(promo_id)
+    if not promocode:
+        raise HTTPException(status_code=404, detail="Промокод не найден")
+
+    if not is_owner(promocode, username):
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "error": "У вас нет прав для удаления этого промокода",
+            "colors": FLOWER_COLORS
+        })
+
+    repo.delete_promo(promo_id)
+    expiry.cancel(promo_id)
+    recommender.forget_promo(promo_id)
+    page_cache.bump()
 
     return RedirectResponse("/", status_code=303)
 
 
 # ========== API ДЛЯ ТРЕКИНГА ==========
 @app.get("/track/{promo_id}/{action}")
-async def track_action(promo_id: int, action: str):
+async def track_action(request: Request, promo_id: int, action: str):
     """Трекинг действий пользователей для статистики"""
-    if promo_id in popularity_stats and action in ["view", "copy", "click"]:
-        popularity_stats[promo_id][action] += 1
+    if action in ACTION_KEYS:
+        update_popularity(promo_id, action, get_current_user(request))
     return {"status": "tracked", "action": action}
 
 
+# Ограничения пачки, чтобы один запрос не мог накрутить счётчики без меры
+TRACK_BATCH_MAX_EVENTS = 500
+TRACK_EVENT_MAX_COUNT = 100
+
+
+class TrackEvent(BaseModel):
+    promo_id: int
+    action: str
+    count: int = Field(1, ge=1, le=TRACK_EVENT_MAX_COUNT)
+
+
+class TrackBatch(BaseModel):
+    events: List[TrackEvent] = Field(..., max_length=TRACK_BATCH_MAX_EVENTS)
+
+
+@app.post("/track/batch")
+async def track_batch(request: Request, batch: TrackBatch):
+    """Пачка событий трекинга одним запросом (буфер trackAction на странице).
+
+    Ограничение track считает события, а не запросы: пачка стоит столько
+    токенов, сколько событий в ней по сумме count, как если бы каждое
+    пришло отдельным GET /track/. Прослойка пропускает пачку за один токен,
+    остальное списывается здесь, и следующие запросы клиента ждут, пока
+    долг не пополнится.
+    """
+    charge(request, sum(event.count for event in batch.events))
+    accepted = update_popularity_batch(batch.events, get_current_user(request))
+    return {"status": "tracked", "events": len(batch.events), "accepted": accepted,
+            "rejected": len(batch.events) - accepted}
+
+
+# ========== JSON API ==========
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+API_STREAM_CHUNK = 500  # записей на одно обращение к хранилищу при потоковой выдаче
+
+
+def api_fields(fields: Optional[str] = Query(None)) -> tuple:
+    """Поля из параметра fields= (через запятую); по умолчанию все"""
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def stream_ndjson(fetch, order: str, after, fields: tuple, limit: Optional[int]):
+    """NDJSON порциями по API_STREAM_CHUNK: в памяти не больше одной порции"""
+    sent = 0
+    while limit is None or sent < limit:
+        chunk = API_STREAM_CHUNK if limit is None else min(API_STREAM_CHUNK, limit - sent)
+        rows = fetch(after, chunk)
+        if not rows:
+            break
+        yield b"".join(dumps(project(promo, fields, counters.get_stats)) + b"\n" for promo in rows)
+        sent += len(rows)
+        if len(rows) < chunk:
+            break
+        after = repo.position(rows[-1], order)
+
+
+def api_response(fetch, order: str, fields: tuple, format: str, cursor: Optional[str], limit: Optional[int]):
+    """NDJSON-поток всех записей от курсора или одна JSON-страница с курсором следующей.
+
+    limit для NDJSON ограничивает число записей в потоке, для JSON -
+    размер страницы (не больше API_MAX_PAGE_SIZE).
+    """
+    if format == "ndjson":
+        try:
+            after = decode_cursor(cursor, order)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return StreamingResponse(stream_ndjson(fetch, order, after, fields, limit),
+                                 media_type="application/x-ndjson")
+
+    page, next_cursor = get_page(fetch, order, cursor, min(limit or API_PAGE_SIZE, API_MAX_PAGE_SIZE))
+    return Response(dumps({
+        "items": [project(promo, fields, counters.get_stats) for promo in page],
+        "next_cursor": next_cursor
+    }), media_type="application/json")
+
+
+@app.get("/api/promocodes")
+async def api_promocodes(fields: tuple = Depends(api_fields),
+                         format: str = Query("json", pattern="^(json|ndjson)$"),
+                         cursor: Optional[str] = Query(None),
+                         limit: Optional[int] = Query(None, ge=1)):
+    """Все промокоды в порядке добавления"""
+    return api_response(repo.list_promos, "id", fields, format, cursor, limit)
+
+
+@app.get("/api/search")
+async def api_search(params: SearchParams = Depends(),
+                     fields: tuple = Depends(api_fields),
+                     format: str = Query("json", pattern="^(json|ndjson)$"),
+                     cursor: Optional[str] = Query(None),
+                     limit: Optional[int] = Query(None, ge=1)):
+    """Поиск с теми же фильтрами и сортировками, что и /search"""
+    return api_response(params.fetch, params.sort_by, fields, format, cursor, limit)
+
+
 # ========== ОСТАЛЬНЫЕ МАРШРУТЫ (как в предыдущей версии) ==========
 @app.get("/register")
 async def register_page(request: Request):
@@ -433,7 +942,7 @@ async def register_page(request: Request):
 
 @app.post("/register")
 async def register_user(request: Request, username: str = Form(...), password: str = Form(...)):
-    if username in users_db:
+    if repo.get_user_password(username) is not None:
         return templates.TemplateResponse("register.html", {
             "request": request,
             "error": "Это имя пользователя уже занято",
@@ -454,7 +963,14 @@ async def register_user(request: Request, username: str = Form(...), password: s
             "colors": FLOWER_COLORS
         })
 
-    users_db[username] = password
+    if not repo.add_user(username, password):
+        # Имя заняли между проверкой и регистрацией (другой запрос или воркер)
+        return templates.TemplateResponse("register.html", {
+            "request": request,
+            "error": "Это имя пользователя уже занято",
+            "colors": FLOWER_COLORS
+        })
+    page_cache.bump()
 
     response = RedirectResponse("/", status_code=303)
     response.set_cookie(key="username", value=username)
@@ -471,7 +987,8 @@ async def login_page(request: Request):
 
 @app.post("/login")
 async def login_user(request: Request, username: str = Form(...), password: str = Form(...)):
-    if username not in users_db or users_db[username] != password:
+    stored_password = repo.get_user_password(username)
+    if stored_password is None or stored_password != password:
         return templates.TemplateResponse("login.html", {
             "request": request,
             "error": "Неверное имя пользователя или пароль",
@@ -498,41 +1015,122 @@ async def add_promo_page(request: Request):
 
 
 @app.get("/my_promocodes")
-async def my_promocodes_page(request: Request):
+async def my_promocodes_page(request: Request,
+                             cursor: Optional[str] = Query(None),
+                             limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
     username = get_current_user(request)
     if not username:
         return RedirectResponse("/login", status_code=303)
+    # Страница показывает суммы счётчиков
+    etag = page_etag(request, username, popular=True)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
 
-    user_promocodes = [p for p in promocodes_db if p["owner"] == username]
+    user_promocodes = repo.promos_by_owner(username)
+    promo_stats = [counters.get_stats(p["id"]) for p in user_promocodes]
+    promocodes, next_cursor = get_page(
+        lambda after, page_limit: repo.promos_by_owner(username, after, page_limit), "id", cursor, limit)
 
     # Статистика пользователя
     user_stats = {
         "total": len(user_promocodes),
         "active": len([p for p in user_promocodes if p["is_active"]]),
-        "total_copies": sum(popularity_stats.get(p["id"], {}).get("copies", 0) for p in user_promocodes),
-        "total_views": sum(popularity_stats.get(p["id"], {}).get("views", 0) for p in user_promocodes),
-        "total_clicks": sum(popularity_stats.get(p["id"], {}).get("clicks", 0) for p in user_promocodes)
+        "total_copies": sum(stats["copies"] for stats in promo_stats),
+        "total_views": sum(stats["views"] for stats in promo_stats),
+        "total_clicks": sum(stats["clicks"] for stats in promo_stats)
     }
 
-    return templates.TemplateResponse("my_promocodes.html", {
+    return with_etag(templates.TemplateResponse("my_promocodes.html", {
         "request": request,
         "username": username,
-        "promocodes": user_promocodes,
+        "promocodes": promocodes,
+        "next_page": next_page_url(request, "my_promocodes", next_cursor),
         "stats": user_stats,
         "colors": FLOWER_COLORS,
         "random_color": get_random_color(),
         "flower_types": FLOWER_TYPES
-    })
+    }), etag)
+
+
+# ========== ФРАГМЕНТЫ ДЛЯ ПОДГРУЗКИ ПРИ ПРОКРУТКЕ ==========
+@app.get("/fragment/home")
+async def home_fragment(request: Request,
+                        cursor: str = Query(...),
+                        limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    promocodes, next_cursor = get_page(repo.list_promos, "id", cursor, limit)
+    return fragment_response(request, "partials/index_cards.html", {
+        "promocodes": promocodes,
+        "colors": FLOWER_COLORS
+    }, next_page_url(request, "home", next_cursor))
+
+
+@app.get("/fragment/search")
+async def search_fragment(request: Request,
+                          params: SearchParams = Depends(),
+                          cursor: str = Query(...),
+                          limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    promocodes, next_cursor = get_page(params.fetch, params.sort_by, cursor, limit)
+    return fragment_response(request, "partials/search_cards.html", {
+        "promocodes": promocodes,
+        "get_stats": counters.get_stats,
+        "colors": FLOWER_COLORS,
+        "flower_types": FLOWER_TYPES
+    }, next_page_url(request, "search", next_cursor))
+
+
+@app.get("/fragment/rating")
+async def rating_fragment(request: Request,
+                          cursor: str = Query(...),
+                          start: int = Query(0, ge=0),
+                          limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    promocodes, next_cursor = get_page(rating_fetch, "rating", cursor, limit)
+    return fragment_response(request, "partials/rating_rows.html", {
+        "promocodes": promocodes,
+        "start": start,
+        "get_stats": counters.get_stats,
+        "popularity_score": popularity_score,
+        "colors": FLOWER_COLORS
+    }, next_page_url(request, "rating", next_cursor, start=start + len(promocodes)))
+
+
+@app.get("/fragment/my_promocodes")
+async def my_promocodes_fragment(request: Request,
+                                 cursor: str = Query(...),
+                                 limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    username = get_current_user(request)
+    if not username:
+        raise HTTPException(status_code=401, detail="Требуется вход")
+
+    promocodes, next_cursor = get_page(
+        lambda after, page_limit: repo.promos_by_owner(username, after, page_limit), "id", cursor, limit)
+    return fragment_response(request, "partials/my_promocodes_rows.html", {
+        "promocodes": promocodes
+    }, next_page_url(request, "my_promocodes", next_cursor))
 
 
 @app.get("/about")
 async def about_page(request: Request):
-    return templates.TemplateResponse("about.html", {
-        "request": request,
-        "username": get_current_user(request),
+    return render_cached(request, "about.html", get_current_user(request), lambda: {
         "colors": FLOWER_COLORS,
-        "flower_quote": get_flower_quote()
-    })
+        "flower_quote": FLOWER_QUOTE
+    }, versioned=False)
+
+
+# ========== МЕТРИКИ ==========
+for name, help, key in [
+    ("promo_page_cache_entries", "Страниц в кеше", "entries"),
+    ("promo_page_cache_bytes", "Размер кеша страниц в байтах", "bytes"),
+    ("promo_page_cache_evictions", "Вытеснено страниц из кеша", "evictions"),
+    ("promo_data_version", "Версия данных кеша страниц", "version"),
+]:
+    registry.register(Gauge(name, help, lambda key=key: page_cache.stats()[key]))
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(registry.expose(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/logout")
@@ -556,8 +1154,11 @@ if __name__ == "__main__":
     print("📚 Инструкции: http://localhost:8000/howto")
     print("=" * 60)
 
-    # Добавляем тестовые промокоды
-    if not promocodes_db:
+    # Тестовые данные добавляем после загрузки сохранённых, если база пуста
+    def seed_demo_data():
+        if repo.count_promos():
+            return
+
         test_promocodes = [
             {
                 "id": 1,
@@ -572,7 +1173,7 @@ if __name__ == "__main__":
                 "owner": "admin",
                 "owner_color": FLOWER_COLORS["rose"],
                 "created_at": "01.03.2024 10:00",
-                "expires_at": "31.03.2024",
+                "expires_at": (datetime.now() + timedelta(days=20)).strftime(EXPIRES_AT_FORMAT),
                 "is_active": True,
                 "views": 142,
                 "copies": 89,
@@ -592,7 +1193,7 @@ if __name__ == "__main__":
                 "owner": "user1",
                 "owner_color": FLOWER_COLORS["lilac"],
                 "created_at": "14.02.2024 18:30",
-                "expires_at": "14.03.2024",
+                "expires_at": (datetime.now() + timedelta(days=10)).strftime(EXPIRES_AT_FORMAT),
                 "is_active": True,
                 "views": 256,
                 "copies": 134,
@@ -612,7 +1213,7 @@ if __name__ == "__main__":
                 "owner": "user2",
                 "owner_color": FLOWER_COLORS["sunflower"],
                 "created_at": "10.03.2024 09:15",
-                "expires_at": "10.04.2024",
+                "expires_at": (datetime.now() + timedelta(days=35)).strftime(EXPIRES_AT_FORMAT),
                 "is_active": True,
                 "views": 98,
                 "copies": 45,
@@ -632,7 +1233,7 @@ if __name__ == "__main__":
                 "owner": "admin",
                 "owner_color": FLOWER_COLORS["violet"],
                 "created_at": "05.03.2024 14:20",
-                "expires_at": "05.04.2024",
+                "expires_at": (datetime.now() + timedelta(days=30)).strftime(EXPIRES_AT_FORMAT),
                 "is_active": True,
                 "views": 76,
                 "copies": 32,
@@ -652,7 +1253,7 @@ if __name__ == "__main__":
                 "owner": "user1",
                 "owner_color": FLOWER_COLORS["lavender"],
                 "created_at": "20.03.2024 11:45",
-                "expires_at": "20.04.2024",
+                "expires_at": (datetime.now() + timedelta(days=45)).strftime(EXPIRES_AT_FORMAT),
                 "is_active": True,
                 "views": 120,
                 "copies": 67,
@@ -672,7 +1273,7 @@ if __name__ == "__main__":
                 "owner": "admin",
                 "owner_color": FLOWER_COLORS["peach"],
                 "created_at": "15.03.2024 16:30",
-                "expires_at": "15.06.2024",
+                "expires_at": (datetime.now() + timedelta(days=90)).strftime(EXPIRES_AT_FORMAT),
                 "is_active": True,
                 "views": 89,
                 "copies": 52,
@@ -681,20 +1282,14 @@ if __name__ == "__main__":
             }
         ]
 
-        promocodes_db.extend(test_promocodes)
-        next_promo_id = 7
-
-        # Инициализируем статистику
         for promo in test_promocodes:
-            popularity_stats[promo["id"]] = {
-                "views": promo["views"],
-                "copies": promo["copies"],
-                "clicks": promo["clicks"]
-            }
+            repo.add_promo(promo)
+            schedule_expiry(promo)
 
         # Тестовые пользователи
-        users_db["admin"] = "admin123"
-        users_db["user1"] = "password1"
-        users_db["user2"] = "password2"
+        for username, password in [("admin", "admin123"), ("user1", "password1"), ("user2", "password2")]:
+            repo.add_user(username, password)
+
+    app.add_event_handler("startup", seed_demo_data)
 
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
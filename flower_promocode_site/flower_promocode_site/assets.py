@@ -0,0 +1,77 @@
+"""Статические файлы с адресами по хешу содержимого"""
+import hashlib
+import os
+from mimetypes import guess_type
+from urllib.parse import parse_qs
+
+from fastapi.staticfiles import StaticFiles
+
+from compression import ENCODING_SUFFIXES, accepted_encodings, precompress
+
+# Файл с актуальным хешем в адресе никогда не меняется - кешируем на год
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+
+class HashedStaticFiles(StaticFiles):
+    """Раздача /static с версионированием адресов.
+
+    url("css/style.css") даёт /static/css/style.css?v=<хеш содержимого>.
+    Запрос с актуальным хешем получает заголовки долгого кеширования,
+    без хеша или со старым хешем - обычную проверку через ETag. Хеши
+    считаются один раз на процесс, то есть один раз на выкладку.
+
+    После precompress() для css/js отдаются готовые копии .br/.gz по
+    Accept-Encoding, без сжатия на каждый запрос.
+    """
+
+    def __init__(self, directory: str, prefix: str = "/static"):
+        super().__init__(directory=directory)
+        self.root = directory
+        self.prefix = prefix
+        self.hashes = {}  # путь -> хеш содержимого
+        self.encodings = {}  # путь -> кодирования, для которых есть сжатая копия
+
+    def precompress(self) -> int:
+        """Создаёт недостающие сжатые копии; число файлов со сжатыми копиями"""
+        self.encodings = precompress(self.root)
+        return len(self.encodings)
+
+    def file_hash(self, path: str) -> str:
+        digest = self.hashes.get(path)
+        if digest is None:
+            with open(os.path.join(self.root, path), "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:12]
+            self.hashes[path] = digest
+        return digest
+
+    def url(self, path: str) -> str:
+        """Адрес файла из static с хешем содержимого"""
+        return f"{self.prefix}/{path}?v={self.file_hash(path)}"
+
+    async def get_response(self, path, scope):
+        available = self.encodings.get(path)
+        encoding = next((e for e in accepted_encodings(scope["headers"]) if e in available), None) if available else None
+        if encoding is not None and scope["method"] in ("GET", "HEAD"):
+            response = self.compressed_response(path, encoding, scope)
+        else:
+            response = await super().get_response(path, scope)
+        if available:
+            response.headers.add_vary_header("Accept-Encoding")
+        if response.status_code in (200, 304):
+            version = parse_qs(scope["query_string"].decode()).get("v", [None])[0]
+            if version is not None and path in self.hashes and version == self.hashes[path]:
+                response.headers["Cache-Control"] = IMMUTABLE_CACHE
+            else:
+                response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    def compressed_response(self, path: str, encoding: str, scope):
+        """Сжатая копия с типом исходного файла; ETag свой у каждой копии"""
+        full_path = os.path.join(self.root, path) + ENCODING_SUFFIXES[encoding]
+        response = self.file_response(full_path, os.stat(full_path), scope)
+        media_type = guess_type(path)[0] or "text/plain"
+        if media_type.startswith("text/"):
+            media_type += "; charset=utf-8"
+        response.headers["content-type"] = media_type
+        response.headers["content-encoding"] = encoding
+        return response
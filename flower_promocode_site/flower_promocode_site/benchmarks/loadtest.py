@@ -0,0 +1,246 @@
+"""Нагрузочный тест основных страниц на синтетическом каталоге
+
+Приложение запускается в этом же процессе (ASGI без сети), запросы
+шлют параллельные клиенты. Для каждого маршрута печатаются p50/p95/p99
+и пропускная способность, результат сравнивается с baseline.json.
+Эталон memory/1k лежит в репозитории; без эталона для выбранных
+--backend и --scale прогон завершается с ошибкой (код 2), пока его не
+запишут через --save-baseline.
+
+    python benchmarks/loadtest.py --scale 100k --backend sqlite
+    python benchmarks/loadtest.py --scale 1k --save-baseline
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from synthetic import APP_DIR, CODE_WORDS, FLOWER_WEIGHTS, SHOP_PREFIXES, build, data_dir, parse_scale
+
+BASELINE_PATH = os.path.join(APP_DIR, "benchmarks", "baseline.json")
+SORT_ORDERS = ["newest", "oldest", "discount_high", "discount_low", "popular"]
+
+
+class Workload:
+    """Случайные, но воспроизводимые запросы к маршрутам"""
+
+    def __init__(self, count: int, seed: int = 1):
+        self.rng = np.random.default_rng(seed)
+        self.count = count
+        self.user_count = max(10, count // 10)
+
+    def user(self) -> dict:
+        return {"Cookie": f"username=user{self.rng.integers(self.user_count)}"}
+
+    def promo_id(self) -> int:
+        # Трекают в основном популярные, но id популярных разбросаны по каталогу
+        return int(self.rng.integers(1, self.count + 1))
+
+    def search_params(self) -> dict:
+        rng = self.rng
+        params = {"sort_by": SORT_ORDERS[rng.integers(len(SORT_ORDERS))]}
+        if rng.random() < 0.5:
+            params["query"] = CODE_WORDS[rng.integers(len(CODE_WORDS))].lower()
+        if rng.random() < 0.4:
+            params["flower_type"] = list(FLOWER_WEIGHTS)[rng.integers(len(FLOWER_WEIGHTS))]
+        if rng.random() < 0.3:
+            params["min_discount"] = int(rng.integers(1, 8)) * 5
+        if rng.random() < 0.2:
+            params["shop"] = SHOP_PREFIXES[rng.integers(len(SHOP_PREFIXES))]
+        return params
+
+    def request(self, route: str) -> tuple:
+        """(метод, адрес, параметры httpx) очередного запроса к маршруту"""
+        if route == "home":
+            return "GET", "/", {}
+        if route == "search":
+            return "GET", "/search", {"params": self.search_params()}
+        if route == "rating":
+            return "GET", "/rating", {}
+        if route == "recommendations":
+            return "GET", "/recommendations", {"headers": self.user()}
+        if route == "track":
+            action = ("view", "copy", "click")[self.rng.integers(3)]
+            return "GET", f"/track/{self.promo_id()}/{action}", {"headers": self.user()}
+        if route == "track_batch":
+            events = [{"promo_id": self.promo_id(), "action": "view"} for _ in range(20)]
+            return "POST", "/track/batch", {"json": {"events": events}, "headers": self.user()}
+        raise ValueError(f"Неизвестный маршрут: {route}")
+
+
+ROUTES = ["home", "search", "rating", "recommendations", "track", "track_batch"]
+
+
+async def measure(client: httpx.AsyncClient, workload: Workload, route: str,
+                  requests: int, concurrency: int, warmup: int) -> dict:
+    """Задержки одного маршрута под нагрузкой concurrency клиентов"""
+    for _ in range(warmup):
+        method, url, kwargs = workload.request(route)
+        await client.request(method, url, **kwargs)
+
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, url, kwargs = workload.request(route)
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "rps": round(len(latencies) / elapsed, 1)
+    }
+
+
+async def run_app(args) -> dict:
+    """Запускает приложение на копии данных и прогоняет маршруты"""
+    source = data_dir(args.backend, args.scale)
+    if not os.path.exists(source):
+        build(args.backend, args.scale)
+
+    # Трекинг меняет данные - работаем с копией, чтобы прогоны были сравнимы
+    workdir = tempfile.mkdtemp(prefix="promo-bench-")
+    try:
+        shutil.copytree(source, os.path.join(workdir, "data"))
+        os.environ["PROMO_DATA_DIR"] = os.path.join(workdir, "data")
+        os.environ["PROMO_STORAGE"] = args.backend
+        # Все запросы идут с одного адреса - ограничение частоты мерило бы само себя
+        os.environ["PROMO_RATE_LIMITS"] = "off"
+        os.chdir(APP_DIR)
+        sys.path.insert(0, APP_DIR)
+        site = importlib.import_module("app")
+
+        started = time.perf_counter()
+        await site.app.router.startup()
+        startup = time.perf_counter() - started
+        print(f"Запуск приложения: {startup:.2f} с")
+
+        results = {}
+        workload = Workload(parse_scale(args.scale))
+        transport = httpx.ASGITransport(app=site.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for route in args.routes:
+                    results[route] = await measure(client, workload, route, args.requests,
+                                                   args.concurrency, args.warmup)
+                    print_row(route, results[route])
+        finally:
+            await site.app.router.shutdown()
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_row(route: str, result: dict, baseline: dict = None):
+    line = (f"{route:<16} {result['requests']:>7} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+            f"{result['p99_ms']:>9.2f} {result['rps']:>9.1f}")
+    if baseline:
+        line += f"   p95 {change(result['p95_ms'], baseline['p95_ms'])}, rps {change(result['rps'], baseline['rps'])}"
+    print(line)
+
+
+def change(value: float, base: float) -> str:
+    return f"{(value - base) / base * 100:+.0f}%" if base else "n/a"
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """Маршруты, где p95 вырос или пропускная способность упала больше допуска.
+
+    Для p95 нужен ещё и абсолютный рост больше min_delta_ms, а пропускная
+    способность сравнивается, только если запрос стоил не меньше
+    min_delta_ms: иначе страницы в доли миллисекунды падали бы от шума.
+    """
+    regressions = []
+    for route, result in results.items():
+        base = baseline.get(route)
+        if base is None:
+            continue
+        if result["errors"]:
+            regressions.append(f"{route}: {result['errors']} ошибочных ответов")
+        p95_limit = max(base["p95_ms"] * (1 + tolerance), base["p95_ms"] + min_delta_ms)
+        if result["p95_ms"] > p95_limit:
+            regressions.append(f"{route}: p95 {result['p95_ms']:.2f} мс, было {base['p95_ms']:.2f} мс")
+        if 1000 / base["rps"] >= min_delta_ms and result["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{route}: {result['rps']:.1f} запросов/с, было {base['rps']:.1f}")
+    return regressions
+
+
+def load_baseline() -> dict:
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест на синтетическом каталоге")
+    parser.add_argument("--scale", default="1k", help="1k, 100k, 1m или число промокодов")
+    parser.add_argument("--backend", default="memory", choices=["memory", "sqlite"])
+    parser.add_argument("--routes", nargs="+", default=ROUTES, choices=ROUTES)
+    parser.add_argument("--requests", type=int, default=500, help="запросов на маршрут")
+    parser.add_argument("--concurrency", type=int, default=16, help="параллельных клиентов")
+    parser.add_argument("--warmup", type=int, default=20, help="запросов на прогрев, не учитываются")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимое ухудшение, доля")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="шум p95, который не считается регрессией")
+    parser.add_argument("--save-baseline", action="store_true", help="записать результат как эталон")
+    args = parser.parse_args()
+
+    key = f"{args.backend}/{args.scale.lower()}"
+    print(f"{key}: {args.requests} запросов на маршрут, {args.concurrency} клиентов")
+    print(f"{'маршрут':<16} {'запросов':>7} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'зап/с':>9}")
+    results = asyncio.run(run_app(args))
+
+    baselines = load_baseline()
+    if args.save_baseline:
+        baselines[key] = {**baselines.get(key, {}), **results}
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"Эталон {key} записан в {BASELINE_PATH}")
+        return
+
+    baseline = baselines.get(key)
+    if not baseline:
+        # Молча пройти без сравнения нельзя: в CI это выглядело бы как "регрессий нет"
+        print(f"Эталона для {key} нет в {BASELINE_PATH} - сравнивать не с чем "
+              f"(запишите его с --save-baseline)", file=sys.stderr)
+        sys.exit(2)
+    print(f"\nСравнение с эталоном {key}:")
+    for route, result in results.items():
+        print_row(route, result, baseline.get(route))
+    regressions = find_regressions(results, baseline, args.tolerance, args.min_delta_ms)
+    if regressions:
+        print("\n" + "!" * 60, file=sys.stderr)
+        print("РЕГРЕССИЯ ПРОИЗВОДИТЕЛЬНОСТИ:", file=sys.stderr)
+        for message in regressions:
+            print(f"  {message}", file=sys.stderr)
+        print("!" * 60, file=sys.stderr)
+        sys.exit(1)
+    print("Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
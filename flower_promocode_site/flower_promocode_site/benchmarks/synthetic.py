@@ -0,0 +1,204 @@
+"""Синтетический каталог для нагрузочных тестов: пользователи, промокоды, история действий
+
+Запуск из папки приложения:
+    python benchmarks/synthetic.py --scale 100k --backend sqlite
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from promos import (CREATED_AT_FORMAT, EXPIRES_AT_FORMAT, FLOWER_TYPES, STAT_KEYS,  # noqa: E402
+                    detect_discount_type, extract_discount_value)
+from recommend import ACTION_WEIGHTS  # noqa: E402
+from repository import create_repository  # noqa: E402
+from storage import Storage  # noqa: E402
+
+BENCH_DATA_DIR = os.path.join(APP_DIR, "benchmarks", "data")
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+# Доли типов цветов (все из promos.FLOWER_TYPES): розы и тюльпаны встречаются намного чаще гортензий
+FLOWER_WEIGHTS = {
+    "Розы": 24, "Тюльпаны": 16, "Разные": 14, "Пионы": 9, "Хризантемы": 7, "Лилии": 6,
+    "Орхидеи": 6, "Герберы": 5, "Альстромерии": 4, "Подсолнухи": 3, "Гортензии": 3, "Ирисы": 3
+}
+SHOP_PREFIXES = ["Цветочный", "Flower", "Букет", "Flora", "Лепесток", "Green", "Сад", "Romantic", "Бутон", "Bloom"]
+SHOP_SUFFIXES = ["рай", "Express", "Delivery", "Маркет", "House", "Studio", "Лавка", "Точка", "Shop", "Мастерская"]
+CODE_WORDS = ["SPRING", "LOVE", "SUNNY", "ORCHID", "GIFT", "FLOWER", "ROSE", "BLOOM", "PETAL", "MAMA", "HAPPY", "FRESH"]
+PERCENT_TARGETS = ["весь каталог", "весенние букеты", "букеты роз", "композиции в коробках", "первый заказ"]
+FIXED_TARGETS = ["первый заказ", "букет роз", "заказ от 3000 руб.", "свадебный букет"]
+OTHER_DISCOUNTS = ["Бесплатная доставка", "Открытка в подарок", "Ваза в подарок к букету"]
+
+
+def parse_scale(scale: str) -> int:
+    """1k, 100k, 1m или просто число промокодов"""
+    scale = scale.lower()
+    return SCALES[scale] if scale in SCALES else int(scale)
+
+
+def data_dir(backend: str, scale: str) -> str:
+    return os.path.join(BENCH_DATA_DIR, f"{backend}-{scale.lower()}")
+
+
+def zipf_weights(n: int, exponent: float = 1.1) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def make_discount(rng: np.random.Generator) -> str:
+    kind = rng.random()
+    if kind < 0.6:
+        return f"{int(rng.integers(1, 15)) * 5}% на {PERCENT_TARGETS[rng.integers(len(PERCENT_TARGETS))]}"
+    if kind < 0.9:
+        return f"{int(rng.integers(2, 41)) * 50} руб. на {FIXED_TARGETS[rng.integers(len(FIXED_TARGETS))]}"
+    return OTHER_DISCOUNTS[rng.integers(len(OTHER_DISCOUNTS))]
+
+
+def make_shops(count: int) -> list:
+    shops = [f"{prefix} {suffix}" for prefix in SHOP_PREFIXES for suffix in SHOP_SUFFIXES]
+    return [shops[i % len(shops)] + (f" {i // len(shops)}" if i >= len(shops) else "") for i in range(count)]
+
+
+def generate(count: int, seed: int = 42):
+    """Промокоды, пользователи и история действий.
+
+    Популярность промокодов распределена по Ципфу: немногие собирают
+    большую часть копирований, как в реальном каталоге. Счётчики
+    промокодов согласованы с историей пользователей.
+    """
+    rng = np.random.default_rng(seed)
+    user_count = max(10, count // 10)
+    users = {f"user{i}": f"password{i}" for i in range(user_count)}
+    usernames = list(users)
+
+    # История: у каждого пользователя в среднем 5 действий, промокоды по Ципфу
+    popularity = rng.permutation(count)  # место промокода в рейтинге популярности
+    by_rank = np.argsort(popularity)
+    events = rng.geometric(0.2, user_count)
+    picked = by_rank[rng.choice(count, int(events.sum()), p=zipf_weights(count))]
+    is_copy = rng.random(len(picked)) < 0.4
+    copies = np.bincount(picked[is_copy], minlength=count)
+    clicks = np.bincount(picked[~is_copy], minlength=count)
+    views = copies + clicks + rng.poisson(3, count)
+
+    # id растут с датой создания, как при обычном добавлении
+    created = rng.integers(0, 365 * 24 * 60, count)  # минут назад
+    ids = np.empty(count, np.int64)
+    ids[np.argsort(-created, kind="stable")] = np.arange(1, count + 1)
+
+    interactions = {}
+    start = 0
+    for username, n in zip(usernames, events):
+        items = interactions.setdefault(username, {})
+        for index, copied in zip(picked[start:start + n], is_copy[start:start + n]):
+            promo_id = int(ids[index])
+            items[promo_id] = items.get(promo_id, 0.0) + ACTION_WEIGHTS["copies" if copied else "clicks"]
+        start += n
+
+    flower_types = list(FLOWER_WEIGHTS)
+    flower_weights = np.array(list(FLOWER_WEIGHTS.values()), dtype=float)
+    flowers = rng.choice(len(flower_types), count, p=flower_weights / flower_weights.sum())
+    shops = make_shops(max(20, count // 50))
+    shop_picks = rng.choice(len(shops), count, p=zipf_weights(len(shops), 0.8))
+    owners = rng.integers(user_count, size=count)
+    now = datetime.now()
+    expires = rng.integers(1, 121, count)
+
+    promocodes = []
+    for i in np.argsort(ids):
+        discount = make_discount(rng)
+        flower_type = flower_types[flowers[i]]
+        promocodes.append({
+            "id": int(ids[i]),
+            "code": f"{CODE_WORDS[i % len(CODE_WORDS)]}{extract_discount_value(discount)}{i:X}",
+            "shop": shops[shop_picks[i]],
+            "discount": discount,
+            "description": f"Скидка на {flower_type.lower()} в магазине {shops[shop_picks[i]]}",
+            "usage_instructions": "Введите код на этапе оплаты заказа",
+            "flower_type": flower_type,
+            "discount_type": detect_discount_type(discount),
+            "discount_value": extract_discount_value(discount),
+            "owner": usernames[owners[i]],
+            "owner_color": "#FF69B4",
+            "created_at": (now - timedelta(minutes=int(created[i]))).strftime(CREATED_AT_FORMAT),
+            "expires_at": (now + timedelta(days=int(expires[i]))).strftime(EXPIRES_AT_FORMAT),
+            "is_active": True,
+            "views": int(views[i]),
+            "copies": int(copies[i]),
+            "clicks": int(clicks[i]),
+            "emoji": FLOWER_TYPES[flower_type]
+        })
+    return users, promocodes, interactions
+
+
+def write_memory(path: str, users: dict, promocodes: list):
+    """Сразу снимок хранилища: без журнала на миллион записей"""
+    storage = Storage(path)
+    storage.load()
+    storage.start()
+    storage.snapshot({
+        "users": users,
+        "promocodes": promocodes,
+        "popularity_stats": {p["id"]: {key: p[key] for key in STAT_KEYS} for p in promocodes},
+        "next_promo_id": len(promocodes) + 1
+    })
+    storage.close()
+
+
+def write_sqlite(path: str, users: dict, promocodes: list):
+    repo = create_repository("sqlite", path)
+    repo.open()
+    repo.conn.execute("BEGIN")
+    for username, password in users.items():
+        repo.add_user(username, password)
+    for promo in promocodes:
+        expected_id = promo["id"]
+        if repo.add_promo(promo)["id"] != expected_id:
+            raise RuntimeError("База уже содержит промокоды")
+    repo.conn.execute("COMMIT")
+    repo.close()
+
+
+def build(backend: str, scale: str, seed: int = 42) -> str:
+    """Создаёт (заново) каталог данных для драйвера и масштаба"""
+    path = data_dir(backend, scale)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    started = time.perf_counter()
+    users, promocodes, interactions = generate(parse_scale(scale), seed)
+    generated = time.perf_counter()
+    if backend == "memory":
+        write_memory(path, users, promocodes)
+    else:
+        write_sqlite(path, users, promocodes)
+
+    with open(os.path.join(path, "interactions.json"), "w", encoding="utf-8") as f:
+        json.dump(interactions, f, ensure_ascii=False)
+
+    print(f"{backend}/{scale}: {len(promocodes)} промокодов, {len(users)} пользователей, "
+          f"{sum(map(len, interactions.values()))} взаимодействий; "
+          f"генерация {generated - started:.1f} с, запись {time.perf_counter() - generated:.1f} с")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетический каталог промокодов")
+    parser.add_argument("--scale", default="1k", help="1k, 100k, 1m или число промокодов")
+    parser.add_argument("--backend", default="memory", choices=["memory", "sqlite"])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    build(args.backend, args.scale, args.seed)
+
+
+if __name__ == "__main__":
+    main()
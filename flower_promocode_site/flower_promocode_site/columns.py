@@ -0,0 +1,256 @@
+"""Числовые поля промокодов по столбцам в массивах NumPy"""
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from facets import DISCOUNT_BUCKETS, SHOP_FACET_LIMIT, empty_facets, top_values
+from promos import STAT_KEYS, extract_discount_value, parse_created_at
+
+# Столбец -> тип элементов
+COLUMNS = {
+    "id": np.int64,
+    "discount": np.int32,
+    "created": np.int64,
+    "active": np.bool_,
+    "flower_type": np.int32,
+    "shop": np.int32,
+    "discount_type": np.int32,
+    "owner": np.int32,
+    "views": np.int64,
+    "copies": np.int64,
+    "clicks": np.int64,
+    "alive": np.bool_,  # False - строка удалённого промокода
+}
+
+# Порядок выдачи -> (столбец ключа, по убыванию); порядок id ключа не требует
+SORT_KEYS = {
+    "newest": ("created", True),
+    "oldest": ("created", False),
+    "discount_high": ("discount", True),
+    "discount_low": ("discount", False),
+    "popular": ("copies", True),
+}
+
+
+class Codebook:
+    """Словарь строка <-> небольшое целое для строковых столбцов"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class ColumnStore:
+    """Хранилище столбцами (struct of arrays) для фильтров и сортировок.
+
+    Строки добавляются в порядке id, поэтому столбец id отсортирован.
+    Выборка select отдаёт только активные промокоды.
+    Удалённые строки только помечаются в alive и вычищаются compact(),
+    когда их становится больше половины. Фильтры - это маски NumPy,
+    сортировка страницы - partition по ключу и lexsort по (ключ, id).
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.dead = 0
+        self.arrays = {name: np.zeros(capacity, dtype) for name, dtype in COLUMNS.items()}
+        self.rows = {}  # id -> номер строки
+        self.flower_types = Codebook()
+        self.shops = Codebook()
+        self.discount_types = Codebook()
+        self.owners = Codebook()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.arrays[name][:self.size]
+
+    def _grow(self):
+        for name, array in self.arrays.items():
+            grown = np.zeros(len(array) * 2, array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.arrays[name] = grown
+
+    def _write(self, row: int, promo: dict):
+        arrays = self.arrays
+        arrays["discount"][row] = extract_discount_value(promo["discount"])
+        arrays["created"][row] = parse_created_at(promo["created_at"])
+        arrays["active"][row] = promo.get("is_active", True)
+        arrays["flower_type"][row] = self.flower_types.encode(promo.get("flower_type") or "")
+        arrays["shop"][row] = self.shops.encode(promo.get("shop") or "")
+        arrays["discount_type"][row] = self.discount_types.encode(promo.get("discount_type") or "")
+        arrays["owner"][row] = self.owners.encode(promo.get("owner") or "")
+
+    def add(self, promo: dict, stats: dict):
+        """Добавляет строку; если значения не разобрать, хранилище не меняется"""
+        if self.size == len(self.arrays["id"]):
+            self._grow()
+        row = self.size
+        # Сначала поля, которые могут не разобраться: строка за size ещё не видна
+        self._write(row, promo)
+        self.size += 1
+        self.rows[promo["id"]] = row
+        self.arrays["id"][row] = promo["id"]
+        self.arrays["alive"][row] = True
+        for key in STAT_KEYS:
+            self.arrays[key][row] = stats.get(key, 0)
+
+    def update(self, promo: dict):
+        row = self.rows.get(promo["id"])
+        if row is not None:
+            self._write(row, promo)
+
+    def remove(self, promo_id: int):
+        row = self.rows.pop(promo_id, None)
+        if row is None:
+            return
+        self.arrays["alive"][row] = False
+        self.dead += 1
+        if self.dead > 1024 and self.dead * 2 > self.size:
+            self.compact()
+
+    def compact(self):
+        """Выкидывает строки удалённых промокодов"""
+        keep = np.flatnonzero(self.column("alive"))
+        for name, array in self.arrays.items():
+            array[:len(keep)] = array[keep]
+        self.size = len(keep)
+        self.dead = 0
+        self.rows = {int(promo_id): row for row, promo_id in enumerate(self.column("id"))}
+
+    def increment(self, promo_id: int, key: str, n: int = 1) -> bool:
+        row = self.rows.get(promo_id)
+        if row is None:
+            return False
+        self.arrays[key][row] += n
+        return True
+
+    def stats(self, promo_id: int) -> Optional[dict]:
+        row = self.rows.get(promo_id)
+        if row is None:
+            return None
+        return {key: int(self.arrays[key][row]) for key in STAT_KEYS}
+
+    def value(self, promo_id: int, name: str) -> int:
+        return int(self.arrays[name][self.rows[promo_id]])
+
+    def position(self, promo_id: int, order: str) -> Tuple[int, ...]:
+        """Позиция записи в выдаче: (ключ, id), ключ растёт вдоль выдачи"""
+        if order not in SORT_KEYS:
+            return (promo_id,)
+        name, descending = SORT_KEYS[order]
+        key = self.value(promo_id, name)
+        return (-key if descending else key, promo_id)
+
+    def select(self, candidates: Optional[Iterable[int]] = None, min_discount: Optional[int] = None,
+               max_discount: Optional[int] = None, flower_type: Optional[str] = None,
+               order: str = "id", after: Optional[Tuple[int, ...]] = None,
+               limit: Optional[int] = None) -> List[int]:
+        """id подходящих промокодов в порядке order, после позиции after"""
+        return self._select(candidates, min_discount, max_discount, flower_type, order, after, limit)[0]
+
+    def select_faceted(self, candidates: Optional[Iterable[int]] = None, min_discount: Optional[int] = None,
+                       max_discount: Optional[int] = None, flower_type: Optional[str] = None,
+                       order: str = "id", after: Optional[Tuple[int, ...]] = None,
+                       limit: Optional[int] = None) -> Tuple[List[int], dict]:
+        """То же, что select, и фасеты по тем же кандидатам за тот же проход"""
+        return self._select(candidates, min_discount, max_discount, flower_type, order, after, limit, True)
+
+    def _select(self, candidates, min_discount, max_discount, flower_type, order, after, limit, faceted=False):
+        rows = None
+        if candidates is not None:
+            # Столбец id отсортирован: строки кандидатов находятся бинарным поиском
+            wanted = np.fromiter(candidates, np.int64)
+            if not len(wanted) or not self.size:
+                return [], empty_facets() if faceted else None
+            id_column = self.column("id")
+            found = np.minimum(np.searchsorted(id_column, wanted), self.size - 1)
+            rows = np.sort(found[id_column[found] == wanted])
+
+        def take(name):
+            column = self.column(name)
+            return column if rows is None else column[rows]
+
+        # Удалённые и неактивные (истёкшие) промокоды не выдаются
+        base = take("alive") & take("active")
+        discount_mask = flower_mask = None
+        if min_discount is not None or max_discount is not None:
+            discount = take("discount")
+            discount_mask = np.ones(len(base), np.bool_)
+            if min_discount is not None:
+                discount_mask &= discount >= min_discount
+            if max_discount is not None:
+                discount_mask &= discount <= max_discount
+        if flower_type is not None:
+            code = self.flower_types.codes.get(flower_type)
+            flower_mask = take("flower_type") == code if code is not None else np.zeros(len(base), np.bool_)
+
+        mask = base
+        for extra in (discount_mask, flower_mask):
+            if extra is not None:
+                mask = mask & extra
+        facets = self._facets(take, base, discount_mask, flower_mask, mask) if faceted else None
+
+        selected = np.flatnonzero(mask) if rows is None else rows[mask]
+        ids = self.column("id")[selected]
+
+        key = None
+        if order in SORT_KEYS:
+            name, descending = SORT_KEYS[order]
+            key = self.column(name)[selected]
+            if descending:
+                key = -key
+
+        if after is not None:
+            if key is None:
+                keep = ids > after[0]
+            else:
+                keep = (key > after[0]) | ((key == after[0]) & (ids > after[1]))
+            ids = ids[keep]
+            if key is not None:
+                key = key[keep]
+
+        if key is not None:
+            if limit is not None and limit < len(ids):
+                # Сначала отбираем не меньше limit наименьших ключей, сортируем только их
+                kth = np.partition(key, limit - 1)[limit - 1]
+                near = key <= kth
+                ids, key = ids[near], key[near]
+            ids = ids[np.lexsort((ids, key))]
+        return ids[:limit].tolist(), facets
+
+    def _facets(self, take, base, discount_mask, flower_mask, mask) -> dict:
+        """Счётчики значений по подходящим строкам.
+
+        Для типа цветов и корзин скидки собственный фильтр не учитывается,
+        иначе фасет показывал бы только уже выбранное значение.
+        """
+        facets = empty_facets()
+        facets["total"] = int(np.count_nonzero(mask))
+        buckets = np.searchsorted(np.array(DISCOUNT_BUCKETS), take("discount"), side="right")
+        sources = {
+            "flower_type": (take("flower_type"), base if discount_mask is None else base & discount_mask,
+                            self.flower_types.values),
+            "shop": (take("shop"), mask, self.shops.values),
+            "discount_type": (take("discount_type"), mask, self.discount_types.values),
+            "discount": (buckets, base if flower_mask is None else base & flower_mask, None),
+        }
+        for field, (codes, where, values) in sources.items():
+            counts = np.bincount(codes[where])
+            present = np.flatnonzero(counts)
+            if field == "shop" and len(present) > SHOP_FACET_LIMIT:
+                # Магазинов могут быть тысячи: в словарь идут только претенденты на top_values
+                threshold = np.partition(counts[present], -SHOP_FACET_LIMIT)[-SHOP_FACET_LIMIT]
+                present = present[counts[present] >= threshold]
+            for code in present:
+                facets[field][values[code] if values is not None else int(code)] = int(counts[code])
+        facets["shop"] = top_values(facets["shop"])
+        return facets
@@ -0,0 +1,179 @@
+"""Сжатие ответов: gzip и brotli для HTML на лету, готовые сжатые копии статики"""
+import os
+import zlib
+from typing import Dict, List, Set
+
+from starlette.datastructures import MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # без brotli остаётся gzip
+    brotli = None
+
+# HTML короче порога отдаётся как есть: выигрыш меньше цены сжатия
+MIN_SIZE = 1024
+# Уровни для сжатия на лету - ради задержки: на страницах каталога (50-70 КБ)
+# это около миллисекунды и размер в 8-9 раз меньше; старшие уровни дают
+# ещё 5-10% за вдвое-втрое большее время
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+# Статика сжимается один раз, поэтому на максимуме
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+# Какие файлы статики имеет смысл сжимать (картинки уже сжаты)
+COMPRESSIBLE_SUFFIXES = (".css", ".js", ".svg", ".html", ".json", ".txt", ".map")
+# Кодирование -> расширение сжатой копии; порядок - предпочтение при выборе
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"} if brotli is not None else {"gzip": ".gz"}
+
+
+def accepted_encodings(headers) -> List[str]:
+    """Поддерживаемые кодирования из Accept-Encoding в порядке предпочтения (br, gzip)"""
+    for name, value in headers:
+        if name == b"accept-encoding":
+            accepted = set()
+            for item in value.decode("latin-1").split(","):
+                coding, _, params = item.strip().partition(";")
+                params = params.strip()
+                if params.startswith("q="):
+                    try:
+                        if float(params[2:]) <= 0:
+                            continue
+                    except ValueError:
+                        continue
+                accepted.add(coding.strip().lower())
+            return [encoding for encoding in ENCODING_SUFFIXES if encoding in accepted or "*" in accepted]
+    return []
+
+
+def compress(data: bytes, encoding: str, static: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=STATIC_BROTLI_QUALITY if static else BROTLI_QUALITY)
+    compressor = zlib.compressobj(STATIC_GZIP_LEVEL if static else GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+class StreamCompressor:
+    """Сжатие потока порциями: каждая порция сбрасывается сразу, чтобы
+    браузер получал шапку страницы до конца рендеринга, как без сжатия"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 - формат gzip
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self.compressor.process(data) + self.compressor.flush()
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+class CompressionMiddleware:
+    """ASGI-прослойка: сжимает HTML-ответы кодированием из Accept-Encoding.
+
+    Ответ целиком сжимается, если он не короче min_size; потоковый ответ
+    (первая порция с more_body) сжимается порциями. Ответы с готовым
+    Content-Encoding (сжатая статика) и не-HTML проходят без изменений.
+    """
+
+    def __init__(self, app, min_size: int = MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        encodings = accepted_encodings(scope["headers"]) if scope["type"] == "http" else []
+        if not encodings:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Заголовки уходят вместе с первой порцией тела, когда ясно, сжимать ли
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is not None:
+                data = compressor.compress(body)
+                if not more_body:
+                    data += compressor.finish()
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            if (start["status"] != 200 or "content-encoding" in headers
+                    or not headers.get("content-type", "").startswith("text/html")):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            headers.add_vary_header("Accept-Encoding")
+            if not more_body and len(body) < self.min_size:
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            headers["content-encoding"] = encodings[0]
+            if more_body:
+                compressor = StreamCompressor(encodings[0])
+                if "content-length" in headers:
+                    del headers["content-length"]
+                body = compressor.compress(body)
+            else:
+                body = compress(body, encodings[0])
+                headers["content-length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def precompress(directory: str) -> Dict[str, Set[str]]:
+    """Пишет рядом с файлами статики сжатые копии (.br, .gz) и возвращает путь -> кодирования.
+
+    Копия, которая новее исходника, не пересоздаётся, поэтому повторный
+    запуск только проверяет даты. Если сжатие не уменьшает файл, копия
+    не нужна.
+    """
+    variants = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_SUFFIXES):
+                continue
+            source = os.path.join(root, name)
+            path = os.path.relpath(source, directory)
+            mtime = os.stat(source).st_mtime
+            data = None
+            for encoding, suffix in ENCODING_SUFFIXES.items():
+                target = source + suffix
+                if not os.path.exists(target) or os.stat(target).st_mtime < mtime:
+                    if data is None:
+                        with open(source, "rb") as f:
+                            data = f.read()
+                    compressed = compress(data, encoding, static=True)
+                    if len(compressed) >= len(data):
+                        if os.path.exists(target):
+                            os.remove(target)
+                        continue
+                    with open(target + ".tmp", "wb") as f:
+                        f.write(compressed)
+                    os.replace(target + ".tmp", target)
+                variants.setdefault(path, set()).add(encoding)
+    return variants
@@ -0,0 +1,79 @@
+"""Отложенная запись счётчиков популярности (write-behind)"""
+import asyncio
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+
+class CounterAggregator:
+    """Копит приращения счётчиков и пишет их в хранилище пачками.
+
+    Повторные события одного промокода складываются по ключу
+    (promo_id, счётчик), поэтому тысяча копирований между сбросами -
+    одна запись в хранилище. Чтения через get_stats добавляют к
+    сохранённым значениям ещё не сброшенные приращения. Порядок
+    рейтинга обновляется при сбросе, то есть отстаёт не больше чем на
+    interval секунд. interval = 0 - запись сразу, без буфера.
+    on_flush вызывается после каждой записи в хранилище.
+    """
+
+    def __init__(self, repo, interval: float = 1.0, on_flush: Optional[Callable[[], None]] = None):
+        self.repo = repo
+        self.interval = interval
+        self.on_flush = on_flush
+        self.pending: Dict[Tuple[int, str], int] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def add(self, promo_id: int, key: str, n: int = 1):
+        if self.interval <= 0:
+            if self.repo.increment(promo_id, key, n) and self.on_flush:
+                self.on_flush()
+            return
+        self.pending[promo_id, key] = self.pending.get((promo_id, key), 0) + n
+
+    def add_many(self, deltas: Iterable[Tuple[int, str, int]]):
+        for promo_id, key, n in deltas:
+            self.add(promo_id, key, n)
+
+    def get_stats(self, promo_id: int) -> dict:
+        """Сохранённая статистика вместе с несброшенными приращениями"""
+        stats = self.repo.get_stats(promo_id)
+        if not self.pending:
+            return stats
+        merged = None
+        for key in stats:
+            delta = self.pending.get((promo_id, key))
+            if delta:
+                if merged is None:
+                    merged = dict(stats)
+                merged[key] += delta
+        return stats if merged is None else merged
+
+    def flush(self) -> int:
+        """Пишет накопленное одной пачкой; возвращает число применённых приращений"""
+        if not self.pending:
+            return 0
+        pending, self.pending = self.pending, {}
+        # Приращения удалённых за это время промокодов хранилище отбросит само
+        applied = self.repo.increment_many((promo_id, key, n) for (promo_id, key), n in pending.items())
+        if applied and self.on_flush:
+            self.on_flush()
+        return applied
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.flush()
+
+    def start(self):
+        if self.interval > 0:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Останавливает фоновый сброс и дописывает остаток буфера"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        self.flush()
@@ -0,0 +1,87 @@
+"""Разовая чистка каталога от дубликатов (код, магазин) за один проход.
+
+Запускается при остановленном сайте:
+
+    python dedup.py --storage sqlite --data-dir data [--dry-run]
+
+Из каждой группы активных промокодов с одинаковым duplicate_key
+остаётся первый добавленный; счётчики популярности и история
+рекомендаций дубликатов переносятся на него, сами дубликаты удаляются.
+"""
+import argparse
+import os
+from typing import Dict, Optional
+
+from promos import STAT_KEYS, duplicate_key
+from recommend import Recommender
+from repository import PromoRepository, create_repository
+
+# Промокодов на одно обращение к хранилищу при проходе по каталогу
+SWEEP_CHUNK = 1000
+
+
+def find_duplicates(repo: PromoRepository) -> Dict[int, int]:
+    """id дубликата -> id оставляемого промокода.
+
+    Каталог читается по порядку id страницами по SWEEP_CHUNK; первый
+    промокод с каждым ключом запоминается в словаре, поэтому весь
+    проход - одно чтение каталога и по одному обращению к словарю на запись.
+    """
+    first = {}  # ключ -> id первого промокода
+    merged = {}
+    after = None
+    while True:
+        page = repo.list_promos(after=after, limit=SWEEP_CHUNK)
+        for promo in page:
+            kept = first.setdefault(duplicate_key(promo["code"], promo["shop"]), promo["id"])
+            if kept != promo["id"]:
+                merged[promo["id"]] = kept
+        if len(page) < SWEEP_CHUNK:
+            return merged
+        after = repo.position(page[-1], "id")
+
+
+def deduplicate(repo: PromoRepository, recommender: Optional[Recommender] = None) -> Dict[int, int]:
+    """Удаляет дубликаты, переносит их счётчики и историю на оставленные промокоды"""
+    merged = find_duplicates(repo)
+    deltas = []
+    for promo_id, kept in merged.items():
+        stats = repo.get_stats(promo_id)
+        deltas += [(kept, key, stats[key]) for key in STAT_KEYS if stats.get(key)]
+    repo.increment_many(deltas)
+    # История переносится до удаления: SQLite удаляет её вместе с промокодом
+    if recommender is not None:
+        recommender.merge_promos(merged)
+    for promo_id in merged:
+        repo.delete_promo(promo_id)
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Удаление дубликатов промокодов")
+    parser.add_argument("--storage", default=os.environ.get("PROMO_STORAGE", "memory"), choices=["memory", "sqlite"])
+    parser.add_argument("--data-dir", default=os.environ.get("PROMO_DATA_DIR", "data"))
+    parser.add_argument("--dry-run", action="store_true", help="только показать, что будет удалено")
+    args = parser.parse_args()
+
+    repo = create_repository(args.storage, args.data_dir)
+    repo.open()
+    try:
+        if args.dry_run:
+            merged = find_duplicates(repo)
+        else:
+            recommender = Recommender(os.path.join(args.data_dir, "interactions.json"), repo=repo)
+            recommender.load()
+            merged = deduplicate(repo, recommender)
+            recommender.save()
+    finally:
+        repo.close()
+
+    for promo_id, kept in sorted(merged.items()):
+        print(f"#{promo_id} -> #{kept}")
+    action = "найдено" if args.dry_run else "удалено"
+    print(f"Дубликатов {action}: {len(merged)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Снятие промокодов с публикации по сроку действия"""
+import asyncio
+import heapq
+import time
+from typing import Callable, List, Optional, Tuple
+
+from promos import parse_expires_at
+
+# Даже при далёком ближайшем сроке проверяем время не реже раза в час:
+# сон не должен зависеть от переводов системных часов
+MAX_SLEEP = 3600
+# С общим хранилищем сроки, добавленные другими воркерами, видны только в базе:
+# ближайший срок перечитывается не реже чем раз в столько секунд
+SHARED_POLL = 60
+
+
+class ExpiryScheduler:
+    """Мин-куча сроков: задача спит до ближайшего и обрабатывает только его.
+
+    При истечении вызывается on_expire(promo_id), а если задан
+    purge_after (секунды), то через столько же после истечения -
+    on_purge(promo_id) для окончательного удаления. Отменённые и
+    перенесённые сроки остаются в куче, но не совпадают с записью в
+    deadlines и при извлечении пропускаются.
+
+    Если хранилище общее для нескольких воркеров (shared - его
+    expiry_due), наступившие сроки берутся из него на каждом проходе, а
+    сон ограничен ближайшим сроком в базе и SHARED_POLL. Своя куча тогда
+    только будит задачу, когда этот процесс добавил промокод с близким
+    сроком.
+    """
+
+    def __init__(self, on_expire: Callable[[int], None], on_purge: Optional[Callable[[int], None]] = None,
+                 purge_after: Optional[float] = None,
+                 shared: Optional[Callable[[float, Optional[float]], Optional[Tuple[List[tuple], Optional[float]]]]] = None):
+        self.on_expire = on_expire
+        self.on_purge = on_purge
+        self.purge_after = purge_after if on_purge is not None else None
+        self.shared = shared
+        self.shared_next = None  # ближайший срок в общем хранилище после последнего прохода
+        self.heap = []  # (время, id, действие)
+        self.deadlines = {}  # (id, действие) -> время
+        self.wakeup = asyncio.Event()
+
+    def schedule(self, promo_id: int, expires_at: Optional[str], is_active: bool = True):
+        """Ставит в очередь истечение активного промокода или удаление истёкшего"""
+        if not expires_at:
+            return
+        try:
+            expires_ts = parse_expires_at(expires_at)
+        except ValueError:
+            return
+        if is_active:
+            self._push(expires_ts, promo_id, "expire")
+        elif self.purge_after is not None:
+            self._push(expires_ts + self.purge_after, promo_id, "purge")
+
+    def cancel(self, promo_id: int):
+        self.deadlines.pop((promo_id, "expire"), None)
+        self.deadlines.pop((promo_id, "purge"), None)
+
+    def _push(self, when: float, promo_id: int, action: str):
+        self.deadlines[promo_id, action] = when
+        heapq.heappush(self.heap, (when, promo_id, action))
+        if self.heap[0] == (when, promo_id, action):
+            # Новый ближайший срок: будим задачу, чтобы она пересчитала сон
+            self.wakeup.set()
+
+    def pop_due(self, now: float):
+        """Наступившие сроки (время, id, действие) в порядке наступления"""
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            when, promo_id, action = heapq.heappop(self.heap)
+            if self.deadlines.get((promo_id, action)) == when:
+                del self.deadlines[promo_id, action]
+                due.append((when, promo_id, action))
+        return due
+
+    def process(self, now: float):
+        due = self.pop_due(now)
+        shared = self.shared(now, self.purge_after) if self.shared is not None else None
+        if shared is not None:
+            # Сроки из своей кучи уже есть в базе, источник один
+            due, self.shared_next = shared
+        for when, promo_id, action in due:
+            if action == "expire":
+                self.on_expire(promo_id)
+                if self.purge_after is not None:
+                    if shared is None:
+                        self._push(when + self.purge_after, promo_id, "purge")
+                    elif self.shared_next is None or when + self.purge_after < self.shared_next:
+                        self.shared_next = when + self.purge_after
+            else:
+                self.on_purge(promo_id)
+
+    def sleep_time(self, now: float) -> float:
+        """Секунд до следующего прохода"""
+        timeout = MAX_SLEEP
+        if self.heap:
+            timeout = min(timeout, max(0.0, self.heap[0][0] - now))
+        if self.shared is not None:
+            timeout = min(timeout, SHARED_POLL)
+            if self.shared_next is not None:
+                timeout = min(timeout, max(0.0, self.shared_next - now))
+        return timeout
+
+    async def run(self):
+        while True:
+            self.process(time.time())
+            # Записи отменённых сроков копятся в куче - изредка пересобираем её
+            if len(self.heap) > 2 * len(self.deadlines) + 1024:
+                self.heap = [(when, promo_id, action) for (promo_id, action), when in self.deadlines.items()]
+                heapq.heapify(self.heap)
+
+            timeout = self.sleep_time(time.time())
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
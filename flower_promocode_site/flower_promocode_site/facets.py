@@ -0,0 +1,81 @@
+"""Счётчики фасетов поиска: сколько промокодов найдётся при каждом значении фильтра"""
+import heapq
+from bisect import bisect_right
+from collections import Counter
+from typing import Optional, Tuple
+
+from promos import extract_discount_value
+
+# Поля фасетов; discount - номер корзины значения скидки
+FACET_FIELDS = ("flower_type", "shop", "discount_type", "discount")
+# Нижние границы корзин скидки, кроме первой: 0-9, 10-19, 20-29, 30-49, 50-99, 100-499, 500-999, 1000+
+DISCOUNT_BUCKETS = (10, 20, 30, 50, 100, 500, 1000)
+# Магазинов в фасете: страница показывает самые частые, остальные доступны через поиск
+SHOP_FACET_LIMIT = 10
+
+
+def discount_bucket(value: int) -> int:
+    return bisect_right(DISCOUNT_BUCKETS, value)
+
+
+def bucket_range(bucket: int) -> Tuple[int, Optional[int]]:
+    """(min_discount, max_discount) корзины для ссылки фильтра"""
+    low = DISCOUNT_BUCKETS[bucket - 1] if bucket else 0
+    high = DISCOUNT_BUCKETS[bucket] - 1 if bucket < len(DISCOUNT_BUCKETS) else None
+    return low, high
+
+
+def bucket_label(bucket: int) -> str:
+    low, high = bucket_range(bucket)
+    return f"{low}+" if high is None else f"{low}–{high}"
+
+
+def empty_facets() -> dict:
+    return {"total": 0, **{field: {} for field in FACET_FIELDS}}
+
+
+def top_values(counts: dict, limit: int = SHOP_FACET_LIMIT) -> dict:
+    """limit самых частых значений по убыванию числа, при равенстве - по имени"""
+    return dict(heapq.nsmallest(limit, counts.items(), key=lambda item: (-item[1], item[0])))
+
+
+def facet_values(promo: dict) -> tuple:
+    return (promo.get("flower_type") or "", promo.get("shop") or "", promo.get("discount_type") or "",
+            discount_bucket(extract_discount_value(promo["discount"])))
+
+
+class FacetCounts:
+    """Фасеты всего каталога, обновляемые при каждом изменении.
+
+    Учитываются только активные промокоды. Поиск без фильтров берёт
+    готовые счётчики отсюда, не проходя по каталогу. Снимок с отобранными
+    магазинами строится один раз на изменение и отдаётся всем поискам
+    до следующего.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.counts = {field: Counter() for field in FACET_FIELDS}
+        self.cached = None  # снимок до следующего изменения
+
+    def add(self, promo: dict):
+        self.cached = None
+        self.total += 1
+        for field, value in zip(FACET_FIELDS, facet_values(promo)):
+            self.counts[field][value] += 1
+
+    def remove(self, promo: dict):
+        self.cached = None
+        self.total -= 1
+        for field, value in zip(FACET_FIELDS, facet_values(promo)):
+            counts = self.counts[field]
+            counts[value] -= 1
+            if counts[value] <= 0:
+                del counts[value]
+
+    def snapshot(self) -> dict:
+        """Фасеты каталога; магазины - только SHOP_FACET_LIMIT самых частых. Не изменять"""
+        if self.cached is None:
+            self.cached = {"total": self.total, **{field: dict(counts) for field, counts in self.counts.items()}}
+            self.cached["shop"] = top_values(self.counts["shop"])
+        return self.cached
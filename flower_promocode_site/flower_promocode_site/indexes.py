@@ -0,0 +1,244 @@
+"""Индексы для быстрого поиска промокодов в памяти"""
+from bisect import bisect_left, insort
+from typing import Callable, Iterable, Iterator, Optional, Set, Tuple
+
+
+def trigrams(text: str) -> Set[str]:
+    """Все подстроки длины 3"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """Инвертированный индекс триграмм для поиска по подстроке.
+
+    Хранит строки полей в нижнем регистре и списки id по каждой
+    триграмме. Запрос пересекает списки триграмм запроса и проверяет
+    кандидатов обычным `in`, поэтому результат совпадает с поиском
+    подстроки по всем записям.
+    """
+
+    def __init__(self, fields=("code", "shop", "description")):
+        self.fields = fields
+        self.postings = {}  # триграмма -> множество id
+        self.docs = {}  # id -> (промокод, строки полей в нижнем регистре)
+
+    def add(self, promo: dict):
+        values = tuple((promo.get(field) or "").lower() for field in self.fields)
+        self.docs[promo["id"]] = (promo, values)
+        for gram in set().union(*(trigrams(value) for value in values)):
+            self.postings.setdefault(gram, set()).add(promo["id"])
+
+    def remove(self, promo_id: int):
+        doc = self.docs.pop(promo_id, None)
+        if doc is None:
+            return
+        for gram in set().union(*(trigrams(value) for value in doc[1])):
+            ids = self.postings[gram]
+            ids.discard(promo_id)
+            if not ids:
+                del self.postings[gram]
+
+    def update(self, promo: dict):
+        self.remove(promo["id"])
+        self.add(promo)
+
+    def search(self, text: str, fields: Optional[Iterable[str]] = None) -> Set[int]:
+        """id промокодов, у которых text входит в одно из полей"""
+        text = text.lower()
+        positions = [i for i, field in enumerate(self.fields) if fields is None or field in fields]
+
+        grams = trigrams(text)
+        if grams:
+            postings = []
+            for gram in grams:
+                ids = self.postings.get(gram)
+                if not ids:
+                    return set()
+                postings.append(ids)
+            postings.sort(key=len)
+            candidates = postings[0].intersection(*postings[1:])
+        else:
+            # Запрос короче триграммы: проверяем все строки
+            candidates = self.docs.keys()
+
+        docs = self.docs
+        return {
+            promo_id for promo_id in candidates
+            if any(text in docs[promo_id][1][i] for i in positions)
+        }
+
+
+# Записей в блоке SortedIndex: блок делится, когда вырастает вдвое
+BLOCK_SIZE = 1000
+
+
+class SortedIndex:
+    """Вторичный индекс, отсортированный по ключу, вычисленному при записи.
+
+    Записи (ключ, id, промокод) лежат по возрастанию в списке блоков
+    до 2 * BLOCK_SIZE записей, рядом - последняя запись каждого блока.
+    Вставка и удаление - bisect по блокам и сдвиг внутри одного блока:
+    O(log n + BLOCK_SIZE) вместо O(n) у одного большого списка, а при
+    делении или слиянии блока ещё O(n / BLOCK_SIZE) на список блоков.
+    Это важно для рейтинга: refresh вызывается на каждое событие
+    трекинга. Фильтр по диапазону - тоже bisect, сортированная выдача -
+    обход блоков. При равных ключах порядок всегда по возрастанию id,
+    как у устойчивой сортировки списка в порядке добавления.
+
+    Позиция в индексе - пара (блок, номер в блоке); конец индекса -
+    (число блоков, 0), поэтому позиции сравниваются как кортежи.
+    """
+
+    def __init__(self, key_func: Callable[[dict], int]):
+        self.key_func = key_func
+        self.blocks = []  # блоки записей (ключ, id, промокод) по возрастанию
+        self.maxes = []  # последняя запись каждого блока
+        self.keys = {}  # id -> ключ
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _locate(self, value: tuple) -> Tuple[int, int]:
+        """Позиция первой записи не меньше value"""
+        b = bisect_left(self.maxes, value)
+        if b == len(self.blocks):
+            return b, 0
+        return b, bisect_left(self.blocks[b], value)
+
+    def _insert(self, entry: tuple):
+        blocks, maxes = self.blocks, self.maxes
+        if not blocks:
+            blocks.append([entry])
+            maxes.append(entry)
+            return
+        b = min(bisect_left(maxes, entry), len(blocks) - 1)
+        block = blocks[b]
+        insort(block, entry)
+        maxes[b] = block[-1]
+        if len(block) > 2 * BLOCK_SIZE:
+            blocks[b:b + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+            maxes[b:b + 1] = [blocks[b][-1], blocks[b + 1][-1]]
+
+    def _delete(self, value: tuple) -> tuple:
+        """Удаляет запись с (ключ, id) = value и возвращает её"""
+        blocks, maxes = self.blocks, self.maxes
+        b, i = self._locate(value)
+        block = blocks[b]
+        entry = block.pop(i)
+        if len(block) >= BLOCK_SIZE // 2 or len(blocks) == 1:
+            if block:
+                maxes[b] = block[-1]
+            else:
+                del blocks[b], maxes[b]
+            return entry
+        # Маленький блок сливается с соседом, слишком большой результат снова делится
+        if b + 1 == len(blocks):
+            b -= 1
+        merged = blocks[b] + blocks[b + 1]
+        parts = [merged] if len(merged) <= 2 * BLOCK_SIZE else [merged[:len(merged) // 2],
+                                                                 merged[len(merged) // 2:]]
+        blocks[b:b + 2] = parts
+        maxes[b:b + 2] = [part[-1] for part in parts]
+        return entry
+
+    def add(self, promo: dict):
+        key = self.key_func(promo)
+        self.keys[promo["id"]] = key
+        self._insert((key, promo["id"], promo))
+
+    def remove(self, promo_id: int):
+        key = self.keys.pop(promo_id, None)
+        if key is None:
+            return
+        self._delete((key, promo_id))
+
+    def update(self, promo: dict):
+        self.remove(promo["id"])
+        self.add(promo)
+
+    def refresh(self, promo_id: int):
+        """Пересчитывает ключ после изменения данных, от которых он зависит"""
+        key = self.keys.get(promo_id)
+        if key is None:
+            return
+        b, i = self._locate((key, promo_id))
+        promo = self.blocks[b][i][2]
+        new_key = self.key_func(promo)
+        if new_key != key:
+            self._delete((key, promo_id))
+            self.keys[promo_id] = new_key
+            self._insert((new_key, promo_id, promo))
+
+    def _bounds(self, low, high):
+        lo = (0, 0) if low is None else self._locate((low,))
+        hi = (len(self.blocks), 0) if high is None else self._locate((high, float("inf")))
+        return lo, hi
+
+    def _before(self, pos: Tuple[int, int]) -> tuple:
+        """Запись перед позицией pos"""
+        b, i = pos
+        return self.blocks[b][i - 1] if i else self.blocks[b - 1][-1]
+
+    def _range(self, start: Tuple[int, int], stop: Tuple[int, int]) -> Iterator[tuple]:
+        """Записи от позиции start до stop по возрастанию"""
+        blocks = self.blocks
+        b, i = start
+        while (b, i) < stop:
+            block = blocks[b]
+            end = stop[1] if b == stop[0] else len(block)
+            yield from block[i:end]
+            b, i = b + 1, 0
+
+    def iterate(self, reverse: bool = False, low: Optional[int] = None, high: Optional[int] = None,
+                candidates: Optional[Set[int]] = None, after: Optional[Tuple[int, int]] = None) -> Iterator[dict]:
+        """Промокоды в порядке ключа, с ограничением диапазона и множества id.
+
+        after - (ключ, id) последней уже выданной записи: обход начинается
+        сразу за ней. Генератор ленивый, поэтому страница из N записей
+        не требует обхода всего индекса.
+        """
+        lo, hi = self._bounds(low, high)
+
+        if candidates is not None and len(candidates) * 8 < len(self.keys):
+            # Кандидатов мало: сортируем только их по готовым ключам
+            keys = self.keys
+            order = (lambda i: (-keys[i], i)) if reverse else (lambda i: (keys[i], i))
+            start = None if after is None else ((-after[0], after[1]) if reverse else after)
+            ids = [
+                promo_id for promo_id in candidates
+                if promo_id in keys
+                and (low is None or keys[promo_id] >= low)
+                and (high is None or keys[promo_id] <= high)
+                and (start is None or order(promo_id) > start)
+            ]
+            ids.sort(key=order)
+            for i in ids:
+                b, j = self._locate((keys[i], i))
+                yield self.blocks[b][j][2]
+            return
+
+        if not reverse:
+            if after is not None:
+                lo = max(lo, self._locate((after[0], after[1] + 1)))
+            for entry in self._range(lo, hi):
+                if candidates is None or entry[1] in candidates:
+                    yield entry[2]
+            return
+
+        if after is not None:
+            # Остаток группы с ключом последней записи
+            key, last_id = after
+            end = min(hi, self._locate((key, float("inf"))))
+            for entry in self._range(max(lo, self._locate((key, last_id + 1))), end):
+                if candidates is None or entry[1] in candidates:
+                    yield entry[2]
+            hi = min(hi, self._locate((key,)))
+
+        # Обратный обход группами равных ключей, внутри группы - по возрастанию id
+        i = hi
+        while i > lo:
+            j = max(lo, self._locate((self._before(i)[0],)))
+            for entry in self._range(j, i):
+                if candidates is None or entry[1] in candidates:
+                    yield entry[2]
+            i = j
@@ -0,0 +1,211 @@
+"""Метрики запросов и шаблонов в текстовом формате Prometheus"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Tuple
+
+from fastapi.templating import Jinja2Templates
+
+# Границы корзин гистограмм в секундах (как по умолчанию в клиентах Prometheus)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Ключ в scope запроса, где копится время рендеринга шаблонов
+RENDER_TIME_KEY = "metrics.render_time"
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Counter:
+    """Счётчик с метками: значения в словаре по кортежу меток"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, n: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + n
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    """Гистограмма с метками: на замер - бинарный поиск корзины и два сложения.
+
+    Счётчики корзин хранятся не накопленными, накапливаются при выдаче.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.values: Dict[tuple, list] = {}  # метки -> [счётчики корзин..., +Inf, сумма]
+
+    def observe(self, value: float, *labels):
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self):
+        for labels, counts in self.values.items():
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                total += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {total}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {counts[-1]}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {total}"
+
+
+class Gauge:
+    """Значение, которое читается функцией в момент выдачи метрик"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, func: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.func = func
+
+    def samples(self):
+        yield f"{self.name} {self.func()}"
+
+
+class LabeledGauge(Counter):
+    """Значения с метками, которые задаются целиком, а не накапливаются"""
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+
+class Registry:
+    """Набор метрик для выдачи на /metrics"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+REQUEST_TIME = registry.register(Histogram(
+    "promo_http_request_duration_seconds", "Полное время обработки запроса", ("method", "route")))
+HANDLER_TIME = registry.register(Histogram(
+    "promo_http_handler_duration_seconds", "Время обработки запроса без рендеринга шаблонов", ("method", "route")))
+RENDER_TIME = registry.register(Histogram(
+    "promo_template_render_duration_seconds", "Время рендеринга шаблона", ("template",)))
+REQUESTS = registry.register(Counter(
+    "promo_http_requests_total", "Запросы по маршрутам и кодам ответа", ("method", "route", "status")))
+TRACK_EVENTS = registry.register(Counter(
+    "promo_track_events_total", "Принятые события трекинга", ("action",)))
+PAGE_CACHE_REQUESTS = registry.register(Counter(
+    "promo_page_cache_requests_total", "Обращения к кешу страниц", ("template", "result")))
+RECOMMEND_CACHE_REQUESTS = registry.register(Counter(
+    "promo_recommend_cache_requests_total", "Обращения к кешу рекомендаций", ("result",)))
+STARTUP_TIME = registry.register(LabeledGauge(
+    "promo_startup_duration_seconds", "Длительность этапов запуска", ("phase",)))
+
+
+def record_render(request, template_name: str, seconds: float):
+    """Учитывает рендеринг шаблона в метрике и во времени текущего запроса"""
+    RENDER_TIME.observe(seconds, template_name)
+    if request is not None and RENDER_TIME_KEY in request.scope:
+        request.scope[RENDER_TIME_KEY] += seconds
+
+
+class InstrumentedTemplates(Jinja2Templates):
+    """Jinja2Templates, которые замеряют рендеринг каждого шаблона"""
+
+    def TemplateResponse(self, name: str, context: dict, *args, **kwargs):
+        started = time.perf_counter()
+        response = super().TemplateResponse(name, context, *args, **kwargs)
+        record_render(context.get("request"), name, time.perf_counter() - started)
+        return response
+
+    def render(self, name: str, context: dict) -> str:
+        """Рендер шаблона в строку (для кеша страниц)"""
+        started = time.perf_counter()
+        html = self.get_template(name).render(context)
+        record_render(context.get("request"), name, time.perf_counter() - started)
+        return html
+
+
+class MetricsMiddleware:
+    """ASGI-прослойка: время запроса, время без шаблонов и коды ответов.
+
+    Метка route - шаблон пути маршрута (/track/{promo_id}/{action}), а не
+    сам адрес, чтобы число рядов не росло с числом промокодов. Маршрут
+    находится по endpoint, который роутер кладёт в scope.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.routes: Dict[object, str] = {}  # endpoint -> шаблон пути
+
+    def route_label(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        label = self.routes.get(endpoint)
+        if label is None:
+            for route in scope["app"].routes:
+                self.routes[getattr(route, "endpoint", None) or getattr(route, "app", None)] = route.path
+            label = self.routes.get(endpoint, "unmatched")
+        return label
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        scope[RENDER_TIME_KEY] = 0.0
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            method = scope["method"]
+            route = self.route_label(scope)
+            REQUEST_TIME.observe(elapsed, method, route)
+            HANDLER_TIME.observe(max(0.0, elapsed - scope[RENDER_TIME_KEY]), method, route)
+            REQUESTS.inc(method, route, status)
@@ -0,0 +1,102 @@
+"""Кеш отрисованных страниц с версией данных"""
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+from markupsafe import Markup, escape
+
+
+class PageCache:
+    """LRU-кеш готового HTML, ограниченный числом записей и байтами.
+
+    Ключ включает номер версии данных: любое изменение содержимого
+    (добавление, правка, удаление, истечение срока) вызывает bump(),
+    и старые страницы просто перестают находиться, а потом вытесняются.
+    Если хранилище общее для нескольких воркеров, версия берётся из него
+    (shared_version) на каждый запрос - так запись другого процесса тоже
+    сбрасывает кеш.
+    Счётчики трекинга меняются каждую секунду и версию не трогают:
+    страницы с ними (рейтинг, счётчики в карточках) добавляют к ключу
+    popularity_version - номер интервала в popularity_ttl секунд.
+    Случайные части страницы (цитата, цвет, эмодзи) рендерятся как
+    метки-комментарии и подставляются в готовый HTML на каждый запрос,
+    поэтому не мешают кешированию.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024,
+                 shared_version: Optional[Callable[[], Optional[int]]] = None,
+                 popularity_ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # ключ -> HTML в байтах
+        self.size = 0
+        self.local_version = 0
+        self.shared_version = shared_version
+        self.popularity_ttl = popularity_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fillers: Dict[bytes, Callable[[], str]] = {}
+
+    def bump(self):
+        """Данные изменились: страницы прежних версий больше не отдаются"""
+        self.local_version += 1
+
+    @property
+    def version(self) -> int:
+        """Общая версия из хранилища, а если его нет - своя"""
+        if self.shared_version is not None:
+            shared = self.shared_version()
+            if shared is not None:
+                return shared
+        return self.local_version
+
+    @property
+    def popularity_version(self) -> int:
+        """Номер интервала popularity_ttl: по часам, поэтому одинаков у всех воркеров"""
+        return int(time.time() // self.popularity_ttl)
+
+    def placeholder(self, name: str, func: Callable[[], str]) -> Markup:
+        """Метка для шаблона; при отдаче заменяется на escape(func())"""
+        marker = f"<!--page-cache:{name}-->"
+        self.fillers[marker.encode()] = func
+        return Markup(marker)
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        body = self.entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return body
+
+    def put(self, key: Hashable, body: bytes):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        if len(body) > self.max_bytes:
+            return
+        self.entries[key] = body
+        self.size += len(body)
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def fill(self, body: bytes) -> bytes:
+        """Подставляет в страницу свежие случайные части"""
+        for marker, func in self.fillers.items():
+            if marker in body:
+                body = body.replace(marker, str(escape(func())).encode())
+        return body
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
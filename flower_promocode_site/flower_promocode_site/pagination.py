@@ -0,0 +1,42 @@
+"""Постраничная выдача по ключу сортировки (keyset) с непрозрачным курсором"""
+import base64
+import json
+from typing import Optional
+
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(order: str, position: tuple) -> str:
+    """Курсор из порядка выдачи и позиции последней показанной записи"""
+    raw = json.dumps([order, *position], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], order: str) -> Optional[tuple]:
+    """Позиция из курсора; ValueError, если курсор испорчен или от другого порядка"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+    except ValueError:
+        raise ValueError("Некорректный курсор")
+    if not isinstance(data, list) or len(data) < 2 or data[0] != order \
+            or not all(isinstance(value, int) for value in data[1:]):
+        raise ValueError("Курсор не подходит к этой выдаче")
+    return tuple(data[1:])
+
+
+def paginate(fetch, position, order: str, cursor: Optional[str], limit: int):
+    """Страница записей и курсор следующей страницы (None, если это последняя).
+
+    fetch(after, limit) достаёт записи после позиции after, position(promo,
+    order) - позиция записи. Запрашиваем на одну запись больше, чтобы
+    узнать, есть ли следующая страница.
+    """
+    rows = fetch(decode_cursor(cursor, order), limit + 1)
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_cursor(order, position(page[-1], order))
@@ -0,0 +1,159 @@
+"""Профилирование отдельного запроса по запросу администратора"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from starlette.requests import cookie_parser
+
+from ratelimit import TokenBuckets
+
+# Параметр адреса, включающий профилирование: /search?query=роза&_profile=1
+PROFILE_PARAM = b"_profile="
+PROFILE_HEADER = "X-Profile"
+# Сколько последних профилей хранится в папке; старые удаляются
+MAX_PROFILES = 50
+# Разных стеков в одном файле, самые частые; дольше MAX_SECONDS запрос не замеряется
+MAX_STACKS = 5000
+MAX_SECONDS = 30.0
+# Профилей с одного адреса: в секунду и подряд
+PROFILE_RATE = 1 / 10
+PROFILE_BURST = 3
+
+
+def collapse(frame) -> str:
+    """Стек кадров в строку формата folded stacks: корень;...;лист"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Сэмплирующий профилировщик одного потока.
+
+    Фоновый поток каждые interval секунд снимает стек наблюдаемого
+    потока через sys._current_frames() и считает одинаковые стеки.
+    Чтобы поток успевал получать GIL, на время замера уменьшается
+    интервал переключения потоков.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.001, max_seconds: float = MAX_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._switch_interval = None
+
+    def start(self):
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval))
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+        return self.stacks
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval):
+            if time.monotonic() > deadline:
+                # Долгий (например, потоковый) ответ: интервал переключения возвращается сразу
+                sys.setswitchinterval(self._switch_interval)
+                return
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+
+class ProfilerMiddleware:
+    """Профиль одного запроса администратора в папку профилей.
+
+    Запрос с параметром _profile=1 от пользователя admin выполняется под
+    сэмплером, стеки сохраняются в формате folded stacks (flamegraph.pl,
+    speedscope, inferno), имя файла приходит в заголовке X-Profile.
+    Сэмплер видит весь поток цикла событий, поэтому параллельные запросы
+    тоже попадают в профиль; одновременно профилируется один запрос.
+    Без параметра в адресе прослойка только проверяет строку запроса.
+
+    Администратор определяется так же, как на сайте, - по cookie username,
+    которую клиент может подставить сам, поэтому защита не сильнее этой
+    авторизации. Чтобы такой запрос не мог забить диск или надолго
+    замедлить процесс, профилей с одного адреса не больше PROFILE_BURST
+    подряд и одного в 1 / PROFILE_RATE секунд (сверх лимита запрос
+    выполняется без профиля), замер длится не дольше MAX_SECONDS, в файле
+    не больше MAX_STACKS стеков, а в папке - MAX_PROFILES последних файлов.
+    """
+
+    def __init__(self, app, profiles_dir: str, admin: str = "admin", interval: float = 0.001,
+                 max_profiles: int = MAX_PROFILES):
+        self.app = app
+        self.profiles_dir = profiles_dir
+        self.admin = admin
+        self.interval = interval
+        self.max_profiles = max_profiles
+        self.limiter = TokenBuckets(PROFILE_RATE, PROFILE_BURST)
+        self.busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or PROFILE_PARAM not in scope["query_string"] or not self.requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self.busy = True
+        name = self.profile_name(scope)
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []),
+                                      (PROFILE_HEADER.lower().encode(), name.encode())]
+            await send(message)
+
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            stacks = sampler.stop()
+            self.busy = False
+            self.write(name, stacks)
+
+    def requested(self, scope) -> bool:
+        """_profile=1 от администратора, и другой запрос сейчас не профилируется"""
+        if self.busy or parse_qs(scope["query_string"].decode("latin-1")).get("_profile") != ["1"]:
+            return False
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                if cookie_parser(value.decode("latin-1")).get("username") != self.admin:
+                    return False
+                client = scope["client"][0] if scope.get("client") else ""
+                return not self.limiter.take(client, time.monotonic())
+        return False
+
+    def profile_name(self, scope) -> str:
+        route = re.sub(r"[^A-Za-z0-9.-]+", "_", scope["path"].strip("/")) or "index"
+        return f"{datetime.now():%Y%m%d-%H%M%S-%f}-{route}.folded"
+
+    def write(self, name: str, stacks: Counter):
+        os.makedirs(self.profiles_dir, exist_ok=True)
+        with open(os.path.join(self.profiles_dir, name), "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common(MAX_STACKS):
+                f.write(f"{stack} {count}\n")
+        # Имена начинаются с даты и времени, поэтому по имени старые идут первыми
+        profiles = sorted(entry for entry in os.listdir(self.profiles_dir) if entry.endswith(".folded"))
+        for old in profiles[:-self.max_profiles]:
+            try:
+                os.remove(os.path.join(self.profiles_dir, old))
+            except FileNotFoundError:  # уже удалил другой воркер
+                pass
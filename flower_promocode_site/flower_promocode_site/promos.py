@@ -0,0 +1,68 @@
+"""Вспомогательные функции для записей промокодов"""
+import re
+from datetime import datetime, timedelta
+
+# Формат даты создания и даты окончания действия промокода
+CREATED_AT_FORMAT = "%d.%m.%Y %H:%M"
+EXPIRES_AT_FORMAT = "%d.%m.%Y"
+
+# Действие трекинга -> счётчик популярности
+ACTION_KEYS = {"view": "views", "copy": "copies", "click": "clicks"}
+STAT_KEYS = ("views", "copies", "clicks")
+# Предел числового значения скидки: столбец discount в ColumnStore - int32
+MAX_DISCOUNT_VALUE = 2 ** 31 - 1
+
+# Типы цветов с иконками (страницы сайта и синтетический каталог benchmarks/synthetic.py)
+FLOWER_TYPES = {
+    "Розы": "🌹", "Тюльпаны": "🌷", "Лилии": "⚜️",
+    "Хризантемы": "🌼", "Пионы": "🌸", "Орхидеи": "💮",
+    "Герберы": "🌻", "Альстромерии": "🏵️", "Подсолнухи": "🌻",
+    "Гортензии": "🔮", "Ирисы": "🔷", "Разные": "💐"
+}
+
+_SEPARATORS = re.compile(r"[^\w]+")
+
+
+def extract_discount_value(discount_str: str) -> int:
+    """Извлекает числовое значение скидки из строки (не больше MAX_DISCOUNT_VALUE)"""
+    # Ищем числа в строке
+    numbers = re.findall(r'\d+', discount_str)
+    if numbers:
+        # Число длиннее 10 цифр заведомо больше предела, его и не переводим в int
+        digits = numbers[0].lstrip("0")
+        return MAX_DISCOUNT_VALUE if len(digits) > 10 else min(int(numbers[0]), MAX_DISCOUNT_VALUE)
+    return 0
+
+
+def detect_discount_type(discount: str) -> str:
+    """Определяет тип скидки по её описанию"""
+    return "percentage" if "%" in discount else "fixed" if any(
+        word in discount.lower() for word in ["руб", "р.", "рублей"]) else "other"
+
+
+def normalize_text(text: str) -> str:
+    """Нижний регистр, ё -> е, пунктуация и пробелы схлопываются в один пробел"""
+    return _SEPARATORS.sub(" ", (text or "").lower().replace("ё", "е")).strip()
+
+
+def duplicate_key(code: str, shop: str) -> str:
+    """Ключ дубликата: код без регистра и разделителей и нормализованный магазин.
+
+    SPRING-30 в "Цветочный рай" и spring30 в "цветочный  рай" - один промокод.
+    """
+    return normalize_text(code).replace(" ", "") + "|" + normalize_text(shop)
+
+
+def parse_created_at(created_at: str) -> int:
+    """Переводит дату создания в секунды эпохи"""
+    return int(datetime.strptime(created_at, CREATED_AT_FORMAT).timestamp())
+
+
+def parse_expires_at(expires_at: str) -> int:
+    """Момент истечения в секундах эпохи: промокод действует до конца указанного дня"""
+    return int((datetime.strptime(expires_at, EXPIRES_AT_FORMAT) + timedelta(days=1)).timestamp())
+
+
+def popularity_score(stats: dict) -> int:
+    """Очки популярности: копирования важнее просмотров, просмотры важнее кликов"""
+    return stats["copies"] * 3 + stats["views"] * 2 + stats.get("clicks", 0)
@@ -0,0 +1,164 @@
+"""Ограничение частоты запросов: корзины токенов по клиенту и маршруту"""
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from metrics import Counter, registry
+
+# Правило -> (метод или None для любого, начало пути, токенов в секунду, размер корзины)
+DEFAULT_LIMITS = {
+    # Токен - одно событие: пачка /track/batch пропускается как один запрос,
+    # а затем обработчик списывает остаток по сумме count (см. charge)
+    "track": (None, "/track/", 5.0, 20),
+    # Подсказки с опечатками считаются в цикле событий; браузер шлёт запрос на паузу в наборе
+    "suggest": ("GET", "/search/suggest", 5.0, 20),
+    "add_promo": ("POST", "/add_promo", 1 / 60, 5),
+    "register": ("POST", "/register", 1 / 60, 3),
+}
+# Клиентов в памяти на одно правило; самые давние вытесняются
+MAX_CLIENTS = 10_000
+
+RATE_LIMITED = registry.register(Counter(
+    "promo_rate_limited_total", "Запросы, отклонённые ограничением частоты", ("rule",)))
+
+
+def parse_limits(spec: Optional[str]) -> Dict[str, tuple]:
+    """Правила из строки "track=5:20,register=0.02:3" (токенов в секунду:корзина).
+
+    Не указанные правила остаются по умолчанию, "off" отключает всё,
+    rule=off - одно правило.
+    """
+    limits = dict(DEFAULT_LIMITS)
+    if spec is None or not spec.strip():
+        return limits
+    if spec.strip() == "off":
+        return {}
+    for item in spec.split(","):
+        name, _, value = item.strip().partition("=")
+        if name not in DEFAULT_LIMITS:
+            raise ValueError(f"Неизвестное правило ограничения: {name}")
+        if value == "off":
+            limits.pop(name, None)
+            continue
+        rate, _, burst = value.partition(":")
+        rate, burst = float(rate), int(burst or 1)
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"Ограничение {name} должно быть вида токенов_в_секунду:корзина, больше нуля")
+        method, prefix = DEFAULT_LIMITS[name][:2]
+        limits[name] = (method, prefix, rate, burst)
+    return limits
+
+
+class TokenBuckets:
+    """Корзины токенов одного правила по клиентам.
+
+    Корзина хранит [токены, время последнего обращения] и пополняется
+    лениво при обращении. Словарь упорядочен по времени обращения:
+    в начале лежат самые давние клиенты. Корзина, простоявшая дольше
+    полного пополнения, ничем не отличается от новой, поэтому такие
+    записи снимаются с начала при каждом обращении, а при переполнении
+    вытесняется самая давняя.
+
+    Запрос пропускается, пока в корзине есть целый токен; debit списывает
+    дополнительную стоимость уже пропущенного запроса и может увести
+    корзину в минус - тогда клиент ждёт, пока долг не пополнится.
+    """
+
+    def __init__(self, rate: float, burst: int, max_clients: int = MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()  # клиент -> [токены, время]
+
+    def _bucket(self, client: str, now: float) -> list:
+        """Пополненная корзина клиента, перенесённая в конец порядка"""
+        buckets = self.buckets
+        while buckets:
+            oldest = next(iter(buckets.values()))
+            # Полное пополнение с учётом долга
+            if now - oldest[1] < (self.burst - oldest[0]) / self.rate:
+                break
+            buckets.popitem(last=False)
+
+        bucket = buckets.get(client)
+        if bucket is None:
+            if len(buckets) >= self.max_clients:
+                buckets.popitem(last=False)
+            bucket = buckets[client] = [float(self.burst), now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            buckets.move_to_end(client)
+        return bucket
+
+    def take(self, client: str, now: float) -> float:
+        """0, если токен взят; иначе секунд до появления токена"""
+        bucket = self._bucket(client, now)
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def debit(self, client: str, now: float, cost: float):
+        """Списывает cost токенов без проверки остатка"""
+        self._bucket(client, now)[0] -= cost
+
+
+def charge(request, cost: float):
+    """Доплата за запрос, который стоит больше одного токена.
+
+    Прослойка пропускает запрос за один токен, пока не знает его стоимости
+    (её можно посчитать только по разобранному телу), и оставляет в
+    request.state свою корзину; обработчик списывает остальное. Без
+    ограничения для маршрута ничего не делает.
+    """
+    limit = getattr(request.state, "rate_limit", None)
+    if limit is not None and cost > 1:
+        buckets, client = limit
+        buckets.debit(client, time.monotonic(), cost - 1)
+
+
+class RateLimitMiddleware:
+    """ASGI-прослойка: 429 до маршрутизации и обработчика.
+
+    Правило выбирается по методу и началу пути, клиент - по адресу из
+    scope["client"]. Запросы к остальным маршрутам проходят после
+    сравнения пути с несколькими префиксами.
+    """
+
+    def __init__(self, app, limits: Optional[Dict[str, tuple]] = None, max_clients: int = MAX_CLIENTS):
+        self.app = app
+        limits = DEFAULT_LIMITS if limits is None else limits
+        self.rules: List[Tuple[str, Optional[str], str, TokenBuckets]] = [
+            (name, method, prefix, TokenBuckets(rate, burst, max_clients))
+            for name, (method, prefix, rate, burst) in limits.items()
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self.rules:
+            path = scope["path"]
+            for name, method, prefix, buckets in self.rules:
+                if path.startswith(prefix) and (method is None or scope["method"] == method):
+                    client = scope["client"][0] if scope.get("client") else ""
+                    wait = buckets.take(client, time.monotonic())
+                    if wait:
+                        RATE_LIMITED.inc(name)
+                        await self.reject(send, wait)
+                        return
+                    # Для charge из обработчика (request.state.rate_limit)
+                    scope.setdefault("state", {})["rate_limit"] = (buckets, client)
+                    break
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def reject(send, wait: float):
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"retry-after", str(math.ceil(wait)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": "Слишком много запросов".encode()})
@@ -0,0 +1,221 @@
+"""Рекомендации по совместным действиям пользователей (item-item)"""
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+# Вес действия в матрице взаимодействий: копирование говорит об интересе сильнее клика
+ACTION_WEIGHTS = {"copies": 3.0, "clicks": 1.0}
+
+
+def build_model(interactions: Dict[str, Dict[int, float]]):
+    """Матрица сходства промокодов по пользователям, которые с ними работали.
+
+    Строки матрицы пользователь x промокод нормируются по столбцам, тогда
+    X.T @ X - косинусное сходство столбцов. Диагональ обнуляется, чтобы
+    промокод не рекомендовал сам себя.
+    """
+    item_ids = sorted({promo_id for items in interactions.values() for promo_id in items})
+    if not item_ids:
+        return None
+    positions = {promo_id: i for i, promo_id in enumerate(item_ids)}
+
+    rows, cols, values = [], [], []
+    for row, items in enumerate(interactions.values()):
+        for promo_id, weight in items.items():
+            rows.append(row)
+            cols.append(positions[promo_id])
+            values.append(weight)
+    matrix = sparse.csr_matrix((values, (rows, cols)), shape=(len(interactions), len(item_ids)))
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    matrix = matrix @ sparse.diags(1.0 / norms)
+    similarity = (matrix.T @ matrix).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+    return np.array(item_ids), positions, similarity
+
+
+class Recommender:
+    """Коллаборативная фильтрация с кешем готовых списков по пользователям.
+
+    Действия копятся в словаре пользователь -> {промокод: вес}. Матрица
+    сходства пересчитывается в фоне (rebuild в отдельном потоке), только
+    если с прошлого пересчёта были новые действия. Готовые списки id
+    лежат в LRU-кеше; запись пользователя сбрасывается при его новых
+    действиях, весь кеш - при изменении каталога и после пересчёта.
+
+    Если хранилище ведёт общую историю (SQLite с несколькими воркерами),
+    действия пачками дописываются в него, а перед пересчётом история
+    перечитывается, когда её меняли другие процессы; иначе она хранится
+    в файле path.
+    """
+
+    def __init__(self, path: str, cache_size: int = 4096, repo=None):
+        self.path = path
+        self.repo = repo
+        self.cache_size = cache_size
+        self.interactions: Dict[str, Dict[int, float]] = {}
+        self.cache = OrderedDict()  # (пользователь, limit) -> список id
+        self.model = None
+        self.dirty = False
+        self.changed = False  # есть несохранённые действия
+        self.version = None  # interactions_version хранилища, по которому загружена история
+        self.pending: Dict[Tuple[str, int], float] = {}  # действия, ещё не записанные в хранилище
+        self.loading = False
+
+    @property
+    def shared(self) -> bool:
+        """История общая и живёт в хранилище, а не в файле"""
+        return self.version is not None
+
+    # ---------- Хранение ----------
+    def load(self):
+        version = self.repo.interactions_version() if self.repo is not None else None
+        if version is not None:
+            self.interactions = self.repo.load_interactions()
+            self.version = version
+        elif os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.interactions = {
+                username: {int(promo_id): weight for promo_id, weight in items.items()}
+                for username, items in data.items()
+            }
+        self.model = build_model(self.interactions)
+
+    def save(self):
+        if self.shared:
+            # Во время перечитывания истории действия ждут следующего сброса:
+            # иначе они могли бы попасть в загружаемые данные и учесться дважды
+            if self.pending and not self.loading:
+                self.repo.add_interactions([(username, promo_id, weight)
+                                            for (username, promo_id), weight in self.pending.items()])
+                self.pending.clear()
+            return
+        if not self.changed:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.interactions, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+    # ---------- Изменения ----------
+    def record(self, username: str, promo_id: int, key: str, n: int = 1):
+        """Учитывает действие пользователя с промокодом"""
+        weight = ACTION_WEIGHTS.get(key)
+        if not username or not weight:
+            return
+        items = self.interactions.setdefault(username, {})
+        items[promo_id] = items.get(promo_id, 0.0) + weight * n
+        if self.shared:
+            self.pending[username, promo_id] = self.pending.get((username, promo_id), 0.0) + weight * n
+        self.forget_user(username)
+        self.dirty = self.changed = True
+
+    def forget_promo(self, promo_id: int):
+        """Убирает удалённый промокод из истории всех пользователей"""
+        # Из общей истории его удаляет хранилище вместе с промокодом
+        for key in [key for key in self.pending if key[1] == promo_id]:
+            del self.pending[key]
+        for items in self.interactions.values():
+            if items.pop(promo_id, None) is not None:
+                self.dirty = self.changed = True
+        self.invalidate()
+
+    def merge_promos(self, merged: Dict[int, int]):
+        """Переносит историю с удалённых дубликатов (id -> id оставленного) за один проход"""
+        if self.shared:
+            self.save()
+            self.repo.merge_interactions(merged)
+        for items in self.interactions.values():
+            for promo_id in [promo_id for promo_id in items if promo_id in merged]:
+                target = merged[promo_id]
+                items[target] = items.get(target, 0.0) + items.pop(promo_id)
+                self.dirty = self.changed = True
+        self.invalidate()
+
+    def forget_user(self, username: str):
+        for key in [key for key in self.cache if key[0] == username]:
+            del self.cache[key]
+
+    def invalidate(self):
+        """Сбрасывает все готовые списки (изменился каталог)"""
+        self.cache.clear()
+
+    async def run(self, interval: float):
+        """Фоновый пересчёт матрицы сходства, если были новые действия"""
+        while True:
+            await asyncio.sleep(interval)
+            if self.shared:
+                await self.refresh()
+            if not self.dirty:
+                continue
+            self.dirty = False
+            snapshot = {username: dict(items) for username, items in self.interactions.items()}
+            self.model = await asyncio.to_thread(build_model, snapshot)
+            self.invalidate()
+
+    async def refresh(self):
+        """Записывает свои действия и перечитывает историю, если её меняли"""
+        self.save()
+        version = self.repo.interactions_version()
+        if version == self.version:
+            return
+        self.loading = True
+        try:
+            interactions = await asyncio.to_thread(self.repo.load_interactions)
+        finally:
+            self.loading = False
+        # Действия, учтённые за время загрузки, в хранилище ещё не записаны
+        for (username, promo_id), weight in self.pending.items():
+            items = interactions.setdefault(username, {})
+            items[promo_id] = items.get(promo_id, 0.0) + weight
+        self.interactions = interactions
+        self.version = version
+        self.dirty = True
+
+    # ---------- Выдача ----------
+    def cached(self, username: str, limit: int) -> Optional[List[int]]:
+        ids = self.cache.get((username, limit))
+        if ids is not None:
+            self.cache.move_to_end((username, limit))
+        return ids
+
+    def store(self, username: str, limit: int, ids: List[int]):
+        self.cache[username, limit] = ids
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def similar(self, username: str, limit: int, exclude: Iterable[int] = ()) -> List[int]:
+        """До limit id промокодов, похожих на те, с которыми работал пользователь"""
+        items = self.interactions.get(username)
+        if not items or self.model is None:
+            return []
+        item_ids, positions, similarity = self.model
+
+        known = [(positions[promo_id], weight) for promo_id, weight in items.items() if promo_id in positions]
+        if not known:
+            return []
+        rows, weights = zip(*known)
+        scores = np.asarray(similarity[list(rows)].T @ np.array(weights)).ravel()
+
+        # Уже знакомые и исключённые промокоды не рекомендуем
+        scores[list(rows)] = 0
+        for promo_id in exclude:
+            position = positions.get(promo_id)
+            if position is not None:
+                scores[position] = 0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        # Лучшие первыми, при равенстве - меньший id
+        candidates = candidates[np.lexsort((item_ids[candidates], -scores[candidates]))]
+        return [int(promo_id) for promo_id in item_ids[candidates]]
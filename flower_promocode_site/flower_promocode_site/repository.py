@@ -0,0 +1,1144 @@
+"""Хранилища данных сайта: общий интерфейс и драйверы (память, SQLite)"""
+import json
+import os
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from itertools import islice
+from typing import Dict, Optional, List, Tuple
+
+from columns import ColumnStore
+from facets import DISCOUNT_BUCKETS, FacetCounts, SHOP_FACET_LIMIT, discount_bucket, empty_facets, top_values
+from indexes import SortedIndex, TrigramIndex
+from promos import STAT_KEYS, duplicate_key, parse_created_at, parse_expires_at, popularity_score
+from storage import Storage
+from suggest import SuggestIndex
+
+
+class PromoRepository:
+    """Интерфейс хранилища: промокоды, пользователи и счётчики популярности"""
+
+    def open(self):
+        """Подключается к хранилищу и загружает данные"""
+
+    def close(self):
+        """Сохраняет несброшенные данные и закрывает хранилище"""
+
+    def checkpoint(self):
+        """Периодическое обслуживание (сжатие журнала и т.п.)"""
+
+    def data_version(self) -> Optional[int]:
+        """Номер изменения данных, общий для всех процессов с этим хранилищем.
+
+        None - данные живут в памяти одного процесса, и версию для кеша
+        страниц он ведёт сам.
+        """
+        return None
+
+    # ---------- Пользователи ----------
+    def get_user_password(self, username: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def add_user(self, username: str, password: str) -> bool:
+        """Регистрирует пользователя; False, если имя уже занято"""
+        raise NotImplementedError
+
+    def count_users(self) -> int:
+        raise NotImplementedError
+
+    # ---------- Промокоды ----------
+    def add_promo(self, promo: dict) -> dict:
+        """Сохраняет промокод, назначает ему id и возвращает его"""
+        raise NotImplementedError
+
+    def get_promo(self, promo_id: int) -> Optional[dict]:
+        raise NotImplementedError
+
+    def existing_ids(self, ids) -> set:
+        """Те из ids, промокоды с которыми есть в хранилище"""
+        return {promo_id for promo_id in set(ids) if self.get_promo(promo_id) is not None}
+
+    def update_promo(self, promo_id: int, fields: dict):
+        raise NotImplementedError
+
+    def delete_promo(self, promo_id: int):
+        raise NotImplementedError
+
+    def find_duplicate(self, code: str, shop: str, exclude_id: Optional[int] = None) -> Optional[dict]:
+        """Активный промокод с тем же ключом duplicate_key (кроме exclude_id) или None"""
+        raise NotImplementedError
+
+    # Списки выдаются постранично по ключу (keyset): after - позиция
+    # последней выданной записи из position(), limit - размер страницы.
+    # Каталог, поиск и рейтинг показывают только активные промокоды,
+    # список владельца - все его промокоды.
+    def list_promos(self, after: Optional[tuple] = None, limit: Optional[int] = None) -> List[dict]:
+        """Активные промокоды в порядке добавления"""
+        raise NotImplementedError
+
+    def promos_by_owner(self, owner: str, after: Optional[tuple] = None,
+                        limit: Optional[int] = None) -> List[dict]:
+        raise NotImplementedError
+
+    def expiry_schedule(self) -> List[tuple]:
+        """(id, expires_at, is_active) всех промокодов - для планировщика истечения"""
+        raise NotImplementedError
+
+    def expiry_due(self, now: float, purge_after: Optional[float]) -> Optional[Tuple[List[tuple], Optional[float]]]:
+        """Сроки из общего хранилища: наступившие (время, id, действие) и ближайший будущий срок.
+
+        Действие - "expire" для активных промокодов, "purge" для истёкших,
+        если задан purge_after. None - сроки знает только этот процесс, и
+        ExpiryScheduler ведёт их сам по expiry_schedule.
+        """
+        return None
+
+    def count_promos(self) -> int:
+        raise NotImplementedError
+
+    def search(self, query: Optional[str] = None, flower_type: Optional[str] = None,
+               shop: Optional[str] = None, min_discount: Optional[int] = None,
+               max_discount: Optional[int] = None, sort_by: str = "newest",
+               after: Optional[tuple] = None, limit: Optional[int] = None) -> List[dict]:
+        """Фильтрация и сортировка для страницы поиска"""
+        raise NotImplementedError
+
+    def search_facets(self, query: Optional[str] = None, flower_type: Optional[str] = None,
+                      shop: Optional[str] = None, min_discount: Optional[int] = None,
+                      max_discount: Optional[int] = None) -> dict:
+        """Фасеты поиска: total и {значение: число} по полям FACET_FIELDS.
+
+        Для типа цветов и корзин скидки собственный фильтр не учитывается,
+        чтобы были видны соседние значения. Магазины - только
+        SHOP_FACET_LIMIT самых частых, уже по убыванию (facets.top_values).
+        Результат может быть общим для нескольких запросов, его не изменяют.
+        """
+        raise NotImplementedError
+
+    def faceted_search(self, query: Optional[str] = None, flower_type: Optional[str] = None,
+                       shop: Optional[str] = None, min_discount: Optional[int] = None,
+                       max_discount: Optional[int] = None, sort_by: str = "newest",
+                       after: Optional[tuple] = None, limit: Optional[int] = None) -> Tuple[List[dict], dict]:
+        """Страница поиска вместе с фасетами"""
+        return (self.search(query, flower_type, shop, min_discount, max_discount, sort_by, after, limit),
+                self.search_facets(query, flower_type, shop, min_discount, max_discount))
+
+    def suggest(self, text: str, limit: int = 10, fuzzy: bool = True) -> List[dict]:
+        """Подсказки по кодам и магазинам активных промокодов.
+
+        Элементы - {"kind": "code" | "shop", "text", "count", "typos"}:
+        сначала совпадения по началу, при нехватке - с опечатками (fuzzy).
+        """
+        raise NotImplementedError
+
+    def top_popular(self, limit: Optional[int] = None, after: Optional[tuple] = None) -> List[dict]:
+        """Промокоды по убыванию очков популярности (порядок "rating")"""
+        raise NotImplementedError
+
+    def position(self, promo: dict, order: str) -> tuple:
+        """Позиция записи в порядке выдачи order (sort_by поиска, "rating" или "id").
+
+        Позиции возрастают вдоль выдачи, поэтому следующая страница - это
+        записи с позицией больше позиции последней показанной.
+        """
+        raise NotImplementedError
+
+    # ---------- Счётчики ----------
+    def increment(self, promo_id: int, key: str, n: int = 1) -> bool:
+        """Увеличивает счётчик; False, если промокода нет"""
+        raise NotImplementedError
+
+    def increment_many(self, deltas) -> int:
+        """Применяет пачку приращений (promo_id, ключ, n); возвращает число применённых"""
+        return sum(self.increment(promo_id, key, n) for promo_id, key, n in deltas)
+
+    def get_stats(self, promo_id: int) -> dict:
+        raise NotImplementedError
+
+    # ---------- История действий для рекомендаций ----------
+    def interactions_version(self) -> Optional[int]:
+        """Номер изменения общей истории действий.
+
+        None - хранилище её не ведёт (данные одного процесса), и
+        Recommender хранит историю в своём файле.
+        """
+        return None
+
+    def load_interactions(self) -> Dict[str, Dict[int, float]]:
+        """Пользователь -> {id промокода: вес}; можно вызывать из другого потока"""
+        raise NotImplementedError
+
+    def add_interactions(self, deltas):
+        """Прибавляет пачку весов (пользователь, id промокода, вес) к общей истории"""
+        raise NotImplementedError
+
+    def merge_interactions(self, merged: Dict[int, int]):
+        """Переносит историю удаляемых дубликатов (id -> id оставленного)"""
+        raise NotImplementedError
+
+
+class MemoryRepository(PromoRepository):
+    """Данные в памяти процесса, изменения пишутся в журнал Storage.
+
+    Подходит для одного процесса: у каждого воркера была бы своя копия.
+    """
+
+    def __init__(self, data_dir: str = "data", compact_every: int = 100_000):
+        self.storage = Storage(data_dir, compact_every=compact_every)
+        self.users = {}
+        self.promocodes = []  # по возрастанию id
+        self.next_promo_id = 1
+        self.by_id = {}  # id -> промокод
+        self.by_owner = {}  # владелец -> id его промокодов по возрастанию
+        self.text_index = TrigramIndex(("code", "shop", "description"))
+        # Скидка, дата, тип цветов и счётчики - столбцами для фильтров и сортировок
+        self.columns = ColumnStore()
+        # Рейтинг: ключ - очки со знаком минус, обновляется при каждом трекинге
+        self.leaderboard = SortedIndex(lambda p: -popularity_score(self.get_stats(p["id"])))
+        # Фасеты всего каталога для поиска без фильтров
+        self.facets = FacetCounts()
+        # Автодополнение и исправление опечаток по кодам и магазинам
+        self.suggestions = SuggestIndex()
+        # Ключ дубликата -> id активных промокодов с этим ключом
+        self.by_key = {}
+
+    def open(self):
+        state = self.storage.load()
+        self.users = state["users"]
+        self.promocodes = state["promocodes"]
+        self.next_promo_id = state["next_promo_id"]
+        popularity_stats = state["popularity_stats"]
+        for promo in self.promocodes:
+            self._index(promo, popularity_stats.get(promo["id"], {}))
+        self.storage.start()
+
+    def close(self):
+        self.storage.snapshot(self._capture_state())
+        self.storage.close()
+
+    def checkpoint(self):
+        self.storage.maybe_snapshot(self._capture_state)
+
+    def _capture_state(self) -> dict:
+        """Копия состояния для снимка (снимается в потоке цикла событий)"""
+        return {
+            "users": dict(self.users),
+            "promocodes": [dict(p) for p in self.promocodes],
+            "popularity_stats": {promo_id: self.columns.stats(promo_id) for promo_id in self.by_id},
+            "next_promo_id": self.next_promo_id
+        }
+
+    # ---------- Пользователи ----------
+    def get_user_password(self, username):
+        return self.users.get(username)
+
+    def add_user(self, username, password):
+        if username in self.users:
+            return False
+        self.users[username] = password
+        self.storage.append("register", username=username, password=password)
+        return True
+
+    def count_users(self):
+        return len(self.users)
+
+    # ---------- Промокоды ----------
+    def add_promo(self, promo):
+        promo["id"] = self.next_promo_id
+        # Запись для журнала - со счётчиками, которые _index переносит в столбцы
+        record = dict(promo)
+        # Сначала индексы: промокод, который не удалось проиндексировать, не попадает
+        # в журнал, иначе на нём же остановилось бы восстановление при запуске
+        self._index(promo, {key: promo.get(key, 0) for key in STAT_KEYS})
+        self.next_promo_id += 1
+        self.promocodes.append(promo)
+        self.storage.append("add_promo", promo=record)
+        return promo
+
+    def get_promo(self, promo_id):
+        return self.by_id.get(promo_id)
+
+    def existing_ids(self, ids):
+        return self.by_id.keys() & set(ids)
+
+    def update_promo(self, promo_id, fields):
+        promo = self.by_id.get(promo_id)
+        if promo is None:
+            return
+        if "owner" in fields and fields["owner"] != promo["owner"]:
+            self._unindex_owner(promo)
+            promo["owner"] = fields["owner"]
+            insort(self.by_owner.setdefault(promo["owner"], []), promo_id)
+        was_active = promo.get("is_active", True)
+        if was_active:
+            self.facets.remove(promo)
+            self.suggestions.remove(promo)
+            self._unindex_key(promo)
+        promo.update(fields)
+        active = promo.get("is_active", True)
+        if active:
+            self.facets.add(promo)
+            self.suggestions.add(promo)
+            self._index_key(promo)
+        if active and (not was_active or any(field in fields for field in self.text_index.fields)):
+            self.text_index.update(promo)
+        elif was_active and not active:
+            # Неактивный промокод не ищется и не участвует в рейтинге
+            self.text_index.remove(promo_id)
+            self.leaderboard.remove(promo_id)
+        if active and not was_active:
+            self.leaderboard.add(promo)
+        self.columns.update(promo)
+        self.storage.append("edit_promo", id=promo_id, fields=fields)
+
+    def delete_promo(self, promo_id):
+        promo = self.by_id.pop(promo_id, None)
+        if promo is None:
+            return
+        # Список упорядочен по id: позиция ищется bisect, без перестройки списка
+        del self.promocodes[bisect_left(self.promocodes, promo_id, key=lambda p: p["id"])]
+        self._unindex_owner(promo)
+        self.text_index.remove(promo_id)
+        self.columns.remove(promo_id)
+        self.leaderboard.remove(promo_id)
+        if promo.get("is_active", True):
+            self.facets.remove(promo)
+            self.suggestions.remove(promo)
+            self._unindex_key(promo)
+        self.storage.append("delete_promo", id=promo_id)
+
+    def _index(self, promo: dict, stats: dict):
+        # Столбцы первыми: только там значения разбираются и могут не подойти,
+        # а при ошибке ColumnStore.add ничего не меняет
+        self.columns.add(promo, stats)
+        # Счётчики живут только в столбцах, копии в записи не нужны
+        for key in STAT_KEYS:
+            promo.pop(key, None)
+        self.by_id[promo["id"]] = promo
+        # id растут, поэтому добавление в конец сохраняет порядок
+        self.by_owner.setdefault(promo["owner"], []).append(promo["id"])
+        if promo.get("is_active", True):
+            self.text_index.add(promo)
+            self.leaderboard.add(promo)
+            self.facets.add(promo)
+            self.suggestions.add(promo)
+            self._index_key(promo)
+
+    def _index_key(self, promo: dict):
+        self.by_key.setdefault(duplicate_key(promo["code"], promo["shop"]), set()).add(promo["id"])
+
+    def _unindex_key(self, promo: dict):
+        key = duplicate_key(promo["code"], promo["shop"])
+        ids = self.by_key[key]
+        ids.discard(promo["id"])
+        if not ids:
+            del self.by_key[key]
+
+    def find_duplicate(self, code, shop, exclude_id=None):
+        ids = self.by_key.get(duplicate_key(code, shop), ())
+        return next((self.by_id[promo_id] for promo_id in sorted(ids) if promo_id != exclude_id), None)
+
+    def _unindex_owner(self, promo: dict):
+        ids = self.by_owner[promo["owner"]]
+        del ids[bisect_left(ids, promo["id"])]
+        if not ids:
+            del self.by_owner[promo["owner"]]
+
+    def list_promos(self, after=None, limit=None):
+        return [self.by_id[promo_id] for promo_id in self.columns.select(after=after, limit=limit)]
+
+    def promos_by_owner(self, owner, after=None, limit=None):
+        ids = self.by_owner.get(owner, [])
+        start = 0 if after is None else bisect_right(ids, after[0])
+        return [self.by_id[promo_id] for promo_id in ids[start:None if limit is None else start + limit]]
+
+    def expiry_schedule(self):
+        return [(p["id"], p.get("expires_at"), p.get("is_active", True)) for p in self.promocodes]
+
+    def count_promos(self):
+        return len(self.promocodes)
+
+    def search(self, query=None, flower_type=None, shop=None, min_discount=None,
+               max_discount=None, sort_by="newest", after=None, limit=None):
+        # Фильтры - маски по столбцам, страница - частичная сортировка по ключу выдачи
+        ids = self.columns.select(self._candidates(query, shop), min_discount, max_discount,
+                                  _flower_filter(flower_type), sort_by, after, limit)
+        return [self.by_id[promo_id] for promo_id in ids]
+
+    def search_facets(self, query=None, flower_type=None, shop=None, min_discount=None, max_discount=None):
+        return self.faceted_search(query, flower_type, shop, min_discount, max_discount, limit=0)[1]
+
+    def faceted_search(self, query=None, flower_type=None, shop=None, min_discount=None,
+                       max_discount=None, sort_by="newest", after=None, limit=None):
+        flower_type = _flower_filter(flower_type)
+        if not query and not shop and flower_type is None and min_discount is None and max_discount is None:
+            # Без фильтров фасеты уже посчитаны для всего каталога
+            ids = self.columns.select(order=sort_by, after=after, limit=limit)
+            facets = self.facets.snapshot()
+        else:
+            ids, facets = self.columns.select_faceted(self._candidates(query, shop), min_discount, max_discount,
+                                                      flower_type, sort_by, after, limit)
+        return [self.by_id[promo_id] for promo_id in ids], facets
+
+    def _candidates(self, query, shop):
+        """Поиск по тексту и магазину через индекс триграмм; None - без текстовых фильтров"""
+        candidates = None
+        if query:
+            candidates = self.text_index.search(query)
+        if shop:
+            shop_matches = self.text_index.search(shop, ("shop",))
+            candidates = shop_matches if candidates is None else candidates & shop_matches
+        return candidates
+
+    def suggest(self, text, limit=10, fuzzy=True):
+        return self.suggestions.suggest(text, limit, fuzzy)
+
+    def top_popular(self, limit=None, after=None):
+        return list(islice(self.leaderboard.iterate(after=after), limit))
+
+    def position(self, promo, order):
+        promo_id = promo["id"]
+        if order == "rating":
+            return (self.leaderboard.keys[promo_id], promo_id)
+        return self.columns.position(promo_id, order)
+
+    # ---------- Счётчики ----------
+    def increment(self, promo_id, key, n=1):
+        if key not in STAT_KEYS or not self.columns.increment(promo_id, key, n):
+            return False
+        self.leaderboard.refresh(promo_id)
+        self.storage.append("track", id=promo_id, key=key, n=n)
+        return True
+
+    def get_stats(self, promo_id):
+        return self.columns.stats(promo_id) or {"views": 0, "copies": 0, "clicks": 0}
+
+
+# Поля промокода, которые хранятся в таблице как есть
+PROMO_COLUMNS = (
+    "id", "code", "shop", "discount", "description", "usage_instructions", "flower_type",
+    "discount_type", "discount_value", "owner", "owner_color", "created_at", "expires_at",
+    "is_active", "views", "copies", "clicks", "emoji"
+)
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS promocodes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    code TEXT NOT NULL,
+    shop TEXT NOT NULL,
+    discount TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    usage_instructions TEXT NOT NULL DEFAULT '',
+    flower_type TEXT NOT NULL,
+    discount_type TEXT NOT NULL,
+    discount_value INTEGER NOT NULL DEFAULT 0,
+    owner TEXT NOT NULL,
+    owner_color TEXT,
+    created_at TEXT NOT NULL,
+    created_ts INTEGER NOT NULL,
+    expires_at TEXT,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    views INTEGER NOT NULL DEFAULT 0,
+    copies INTEGER NOT NULL DEFAULT 0,
+    clicks INTEGER NOT NULL DEFAULT 0,
+    emoji TEXT,
+    -- Строки в нижнем регистре Python: у SQLite lower() работает только с ASCII
+    code_lc TEXT NOT NULL,
+    shop_lc TEXT NOT NULL,
+    description_lc TEXT NOT NULL,
+    -- promos.duplicate_key(code, shop): в SQL его не вычислить, пишется из Python
+    dup_key TEXT,
+    -- promos.parse_expires_at(expires_at): срок, по которому воркеры ищут ближайшее истечение
+    expires_ts INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_promocodes_owner ON promocodes (owner, id);
+CREATE INDEX IF NOT EXISTS idx_promocodes_flower_type ON promocodes (flower_type);
+CREATE INDEX IF NOT EXISTS idx_promocodes_created_ts ON promocodes (created_ts);
+CREATE INDEX IF NOT EXISTS idx_promocodes_discount_value ON promocodes (discount_value);
+-- Тот же порядок, что в top_popular: первые K строк читаются без сортировки
+CREATE INDEX IF NOT EXISTS idx_promocodes_score ON promocodes ((copies * 3 + views * 2 + clicks) DESC, id);
+"""
+
+SCORE_SQL = "copies * 3 + views * 2 + clicks"
+
+
+def _bucket_sql(column: str) -> str:
+    """Номер корзины скидки из facets.DISCOUNT_BUCKETS по столбцу SQLite"""
+    return "CASE " + " ".join(
+        f"WHEN {column} >= {low} THEN {bucket}"
+        for bucket, low in reversed(list(enumerate(DISCOUNT_BUCKETS, 1)))
+    ) + " ELSE 0 END"
+
+
+# Поле фасета -> выражение от строки {row} (NEW или OLD в триггере)
+FACET_SQL = (
+    ("flower_type", "{row}.flower_type"),
+    ("shop", "{row}.shop"),
+    ("discount_type", "{row}.discount_type"),
+    ("discount", _bucket_sql("{row}.discount_value")),
+)
+
+
+def _facet_upsert(row: str, n: int) -> str:
+    values = ", ".join(f"('{field}', {expr.format(row=row)}, {n})" for field, expr in FACET_SQL)
+    return (f"INSERT INTO facet_counts (field, value, n) VALUES {values} "
+            f"ON CONFLICT (field, value) DO UPDATE SET n = n + excluded.n;")
+
+
+# Фасеты активных промокодов всего каталога: триггеры обновляют их при любом
+# изменении из любого воркера, поэтому поиск без фильтров не сканирует таблицу
+FACETS_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS facet_counts (
+    field TEXT NOT NULL,
+    value,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (field, value)
+);
+
+CREATE TRIGGER IF NOT EXISTS facets_insert AFTER INSERT ON promocodes WHEN NEW.is_active BEGIN
+    {_facet_upsert("NEW", 1)}
+END;
+
+CREATE TRIGGER IF NOT EXISTS facets_delete AFTER DELETE ON promocodes WHEN OLD.is_active BEGIN
+    {_facet_upsert("OLD", -1)}
+END;
+
+CREATE TRIGGER IF NOT EXISTS facets_update_old
+AFTER UPDATE OF flower_type, shop, discount_type, discount_value, is_active ON promocodes WHEN OLD.is_active BEGIN
+    {_facet_upsert("OLD", -1)}
+END;
+
+CREATE TRIGGER IF NOT EXISTS facets_update_new
+AFTER UPDATE OF flower_type, shop, discount_type, discount_value, is_active ON promocodes WHEN NEW.is_active BEGIN
+    {_facet_upsert("NEW", 1)}
+END;
+"""
+
+# Счётчик изменений кодов, магазинов и активности: по нему воркер видит,
+# что индекс подсказок в его памяти устарел из-за записи другого процесса
+SUGGEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS suggest_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    n INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO suggest_version (id, n) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS suggest_insert AFTER INSERT ON promocodes WHEN NEW.is_active BEGIN
+    UPDATE suggest_version SET n = n + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS suggest_delete AFTER DELETE ON promocodes WHEN OLD.is_active BEGIN
+    UPDATE suggest_version SET n = n + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS suggest_update
+AFTER UPDATE OF code, shop, is_active ON promocodes WHEN OLD.is_active OR NEW.is_active BEGIN
+    UPDATE suggest_version SET n = n + 1;
+END;
+"""
+
+# Номер изменения каталога и пользователей для кеша страниц и ETag всех воркеров.
+# Счётчики популярности его не меняют: их сбрасывают каждую секунду, и страницы
+# со счётчиками устаревают по своему интервалу (PageCache.popularity_version)
+VERSIONED_COLUMNS = ", ".join(c for c in PROMO_COLUMNS if c != "id" and c not in STAT_KEYS)
+DATA_VERSION_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS data_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    n INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO data_version (id, n) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS data_version_insert AFTER INSERT ON promocodes BEGIN
+    UPDATE data_version SET n = n + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_delete AFTER DELETE ON promocodes BEGIN
+    UPDATE data_version SET n = n + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_update AFTER UPDATE OF {VERSIONED_COLUMNS} ON promocodes BEGIN
+    UPDATE data_version SET n = n + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_users AFTER INSERT ON users BEGIN
+    UPDATE data_version SET n = n + 1;
+END;
+"""
+
+# История действий для рекомендаций, общая для воркеров: каждый дописывает свои
+# действия пачкой и по interactions_version видит, что историю меняли другие
+INTERACTIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    username TEXT NOT NULL,
+    promo_id INTEGER NOT NULL,
+    weight REAL NOT NULL,
+    PRIMARY KEY (username, promo_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_interactions_promo ON interactions (promo_id);
+
+CREATE TABLE IF NOT EXISTS interactions_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    n INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO interactions_version (id, n) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS interactions_forget AFTER DELETE ON promocodes BEGIN
+    DELETE FROM interactions WHERE promo_id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS interactions_delete AFTER DELETE ON interactions BEGIN
+    UPDATE interactions_version SET n = n + 1;
+END;
+"""
+ADD_INTERACTION = (
+    "INSERT INTO interactions (username, promo_id, weight) VALUES (?, ?, ?) "
+    "ON CONFLICT (username, promo_id) DO UPDATE SET weight = weight + excluded.weight"
+)
+
+# Порядок выдачи -> (выражение сортировки, по убыванию); при равенстве - по id
+SQLITE_ORDERS = {
+    "newest": ("created_ts", True),
+    "oldest": ("created_ts", False),
+    "discount_high": ("discount_value", True),
+    "discount_low": ("discount_value", False),
+    "popular": ("copies", True),
+    "rating": (SCORE_SQL, True),
+}
+
+
+class SQLiteRepository(PromoRepository):
+    """Общая база SQLite в режиме WAL для нескольких воркеров на одной машине.
+
+    Каждый процесс открывает своё соединение; счётчики увеличиваются
+    атомарным UPDATE, поэтому трекинг не расходится между воркерами.
+    """
+
+    def __init__(self, path: str = "data/promocodes.db"):
+        self.path = path
+        self.conn = None
+        # Индекс подсказок в памяти процесса и значение suggest_version, которому он соответствует
+        self.suggestions = SuggestIndex()
+        self.suggest_version = None
+        # Замена индекса фоновой перестройкой и правка на месте после своей записи не пересекаются
+        self.suggest_lock = threading.Lock()
+        self.suggest_thread = None
+        # Фасеты каталога и data_version, по которой они прочитаны
+        self.facets = None
+        self.facets_version = None
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA busy_timeout = 5000")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(SQLITE_SCHEMA)
+        self.conn.executescript(FACETS_SCHEMA)
+        self.conn.executescript(SUGGEST_SCHEMA)
+        self.conn.executescript(DATA_VERSION_SCHEMA)
+        self.conn.executescript(INTERACTIONS_SCHEMA)
+        self._import_interactions()
+        self._add_dup_keys()
+        self._add_expires_ts()
+        # Поиск дубликата - точное совпадение ключа среди активных промокодов
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_promocodes_dup_key ON promocodes (dup_key) WHERE is_active = 1"
+        )
+        # Ближайший срок и наступившие сроки отдельно для активных и истёкших
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_promocodes_expires ON promocodes (is_active, expires_ts) "
+            "WHERE expires_ts IS NOT NULL"
+        )
+        if self.conn.execute("SELECT NOT EXISTS (SELECT 1 FROM facet_counts)").fetchone()[0]:
+            self._rebuild_facets()
+
+    def _rebuild_facets(self):
+        """Заполняет facet_counts по таблице (база создана до появления фасетов)"""
+        selects = " UNION ALL ".join(
+            f"SELECT '{field}', {expr.format(row='promocodes')}, COUNT(*) FROM promocodes WHERE is_active = 1 GROUP BY 2"
+            for field, expr in FACET_SQL
+        )
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("DELETE FROM facet_counts")
+            self.conn.execute(f"INSERT INTO facet_counts (field, value, n) {selects}")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _add_dup_keys(self):
+        """Добавляет столбец dup_key в базу, созданную до проверки дубликатов"""
+        if "dup_key" in self._columns():
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Другой воркер мог добавить столбец, пока ждали блокировку
+            if "dup_key" not in self._columns():
+                self.conn.execute("ALTER TABLE promocodes ADD COLUMN dup_key TEXT")
+                rows = self.conn.execute("SELECT id, code, shop FROM promocodes").fetchall()
+                self.conn.executemany("UPDATE promocodes SET dup_key = ? WHERE id = ?",
+                                      ((duplicate_key(code, shop), promo_id) for promo_id, code, shop in rows))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _add_expires_ts(self):
+        """Добавляет столбец expires_ts в базу, созданную до общего прохода по срокам"""
+        if "expires_ts" in self._columns():
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Другой воркер мог добавить столбец, пока ждали блокировку
+            if "expires_ts" not in self._columns():
+                self.conn.execute("ALTER TABLE promocodes ADD COLUMN expires_ts INTEGER")
+                rows = self.conn.execute("SELECT id, expires_at FROM promocodes WHERE expires_at IS NOT NULL").fetchall()
+                self.conn.executemany("UPDATE promocodes SET expires_ts = ? WHERE id = ?",
+                                      ((_expires_ts(expires_at), promo_id) for promo_id, expires_at in rows))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _import_interactions(self):
+        """Переносит в базу историю из interactions.json, которую раньше вёл каждый процесс"""
+        path = os.path.join(os.path.dirname(self.path), "interactions.json")
+        if not os.path.exists(path):
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        imported = False
+        try:
+            # Другой воркер мог перенести файл, пока ждали блокировку
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.conn.executemany(ADD_INTERACTION, (
+                    (username, int(promo_id), weight)
+                    for username, items in data.items() for promo_id, weight in items.items()
+                ))
+                self.conn.execute("UPDATE interactions_version SET n = n + 1")
+                os.replace(path, path + ".imported")
+                imported = True
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            if imported:
+                os.replace(path + ".imported", path)
+            raise
+
+    def _columns(self) -> set:
+        return {row["name"] for row in self.conn.execute("PRAGMA table_info(promocodes)")}
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def checkpoint(self):
+        self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def data_version(self):
+        return self.conn.execute("SELECT n FROM data_version").fetchone()[0]
+
+    # ---------- Пользователи ----------
+    def get_user_password(self, username):
+        row = self.conn.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        return row["password"] if row else None
+
+    def add_user(self, username, password):
+        # Проверка имени и вставка - одна операция: два воркера не перезапишут пароль друг друга
+        try:
+            self.conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def count_users(self):
+        return self.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    # ---------- Промокоды ----------
+    def add_promo(self, promo):
+        # Отсутствующие поля получают значения по умолчанию из схемы ('' для описания,
+        # активен, нулевые счётчики) - как в хранилище в памяти
+        columns = [c for c in PROMO_COLUMNS if c != "id" and promo.get(c) is not None]
+        values = [promo[c] for c in columns]
+        columns += ["created_ts", "code_lc", "shop_lc", "description_lc", "dup_key", "expires_ts"]
+        values += [
+            parse_created_at(promo["created_at"]),
+            promo["code"].lower(),
+            promo["shop"].lower(),
+            (promo.get("description") or "").lower(),
+            duplicate_key(promo["code"], promo["shop"]),
+            _expires_ts(promo.get("expires_at"))
+        ]
+        cursor = self._write_catalog(
+            f"INSERT INTO promocodes ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            values
+        )
+        promo["id"] = cursor.lastrowid
+        return promo
+
+    def get_promo(self, promo_id):
+        row = self.conn.execute("SELECT * FROM promocodes WHERE id = ?", (promo_id,)).fetchone()
+        return _row_to_promo(row) if row else None
+
+    def existing_ids(self, ids):
+        # Один запрос на пачку трекинга (до TRACK_BATCH_MAX_EVENTS id) вместо запроса на событие
+        ids = list(set(ids))
+        if not ids:
+            return set()
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        rows = cursor.execute(f"SELECT id FROM promocodes WHERE id IN ({', '.join('?' * len(ids))})", ids)
+        return {promo_id for promo_id, in rows}
+
+    def update_promo(self, promo_id, fields):
+        fields = {k: v for k, v in fields.items() if k in PROMO_COLUMNS and k != "id"}
+        if not fields:
+            return
+        for key in ("code", "shop", "description"):
+            if key in fields:
+                fields[key + "_lc"] = fields[key].lower()
+        if "code" in fields or "shop" in fields:
+            current = {**(self.get_promo(promo_id) or {}), **fields}
+            fields["dup_key"] = duplicate_key(current.get("code", ""), current.get("shop", ""))
+        if "expires_at" in fields:
+            fields["expires_ts"] = _expires_ts(fields["expires_at"])
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        self._write_catalog(f"UPDATE promocodes SET {assignments} WHERE id = ?", [*fields.values(), promo_id], promo_id)
+
+    def delete_promo(self, promo_id):
+        self._write_catalog("DELETE FROM promocodes WHERE id = ?", (promo_id,), promo_id)
+
+    def _write_catalog(self, sql, params, promo_id=None):
+        """Изменение промокода с переносом в индекс подсказок без его перестройки.
+
+        suggest_version читается в той же транзакции до и после записи:
+        если до неё счётчик уже не совпадал с индексом (каталог менял
+        другой воркер), индекс перестроится при следующей подсказке.
+        Внутри уже открытой транзакции (массовая загрузка) используется
+        точка сохранения; если внешняя транзакция откатится, счётчик в
+        базе разойдётся с индексом и тот тоже перестроится.
+        """
+        nested = self.conn.in_transaction
+        self.conn.execute("SAVEPOINT catalog_write" if nested else "BEGIN IMMEDIATE")
+        try:
+            before = self._suggest_version()
+            old = self.get_promo(promo_id) if promo_id is not None else None
+            cursor = self.conn.execute(sql, params)
+            new = self.get_promo(promo_id if promo_id is not None else cursor.lastrowid)
+            after = self._suggest_version()
+            self.conn.execute("RELEASE catalog_write" if nested else "COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK TO catalog_write" if nested else "ROLLBACK")
+            if nested:
+                self.conn.execute("RELEASE catalog_write")
+            raise
+        with self.suggest_lock:
+            if self.suggest_version == before:
+                if old is not None and old["is_active"]:
+                    self.suggestions.remove(old)
+                if new is not None and new["is_active"]:
+                    self.suggestions.add(new)
+                self.suggest_version = after
+        return cursor
+
+    def _suggest_version(self) -> int:
+        return self.conn.execute("SELECT n FROM suggest_version").fetchone()[0]
+
+    def find_duplicate(self, code, shop, exclude_id=None):
+        row = self.conn.execute(
+            "SELECT * FROM promocodes WHERE dup_key = ? AND is_active = 1 AND id != ? ORDER BY id LIMIT 1",
+            (duplicate_key(code, shop), -1 if exclude_id is None else exclude_id)
+        ).fetchone()
+        return _row_to_promo(row) if row else None
+
+    def list_promos(self, after=None, limit=None):
+        return self._fetch_page(["is_active = 1"], [], "id", after, limit)
+
+    def promos_by_owner(self, owner, after=None, limit=None):
+        return self._fetch_page(["owner = ?"], [owner], "id", after, limit)
+
+    def expiry_schedule(self):
+        rows = self.conn.execute("SELECT id, expires_at, is_active FROM promocodes")
+        return [(row["id"], row["expires_at"], bool(row["is_active"])) for row in rows]
+
+    def expiry_due(self, now, purge_after):
+        # Проход общий: промокод, добавленный любым воркером, истечёт у того, кто проснётся первым
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        due = [(when, promo_id, "expire") for promo_id, when in cursor.execute(
+            "SELECT id, expires_ts FROM promocodes WHERE is_active = 1 AND expires_ts <= ? ORDER BY expires_ts",
+            (now,))]
+        upcoming = [cursor.execute(
+            "SELECT MIN(expires_ts) FROM promocodes WHERE is_active = 1 AND expires_ts > ?", (now,)).fetchone()[0]]
+        if purge_after is not None:
+            due += [(when + purge_after, promo_id, "purge") for promo_id, when in cursor.execute(
+                "SELECT id, expires_ts FROM promocodes WHERE is_active = 0 AND expires_ts <= ? ORDER BY expires_ts",
+                (now - purge_after,))]
+            oldest = cursor.execute("SELECT MIN(expires_ts) FROM promocodes WHERE is_active = 0 AND expires_ts > ?",
+                                    (now - purge_after,)).fetchone()[0]
+            upcoming.append(None if oldest is None else oldest + purge_after)
+        return due, min((when for when in upcoming if when is not None), default=None)
+
+    def count_promos(self):
+        return self.conn.execute("SELECT COUNT(*) FROM promocodes").fetchone()[0]
+
+    def search(self, query=None, flower_type=None, shop=None, min_discount=None,
+               max_discount=None, sort_by="newest", after=None, limit=None):
+        where, params = _text_where(query, shop)
+        flower_type = _flower_filter(flower_type)
+        if flower_type is not None:
+            where.append("flower_type = ?")
+            params.append(flower_type)
+        discount_sql, discount_params = _discount_where(min_discount, max_discount)
+        if discount_sql:
+            where.append(discount_sql)
+            params += discount_params
+
+        return self._fetch_page(where, params, sort_by, after, limit)
+
+    def search_facets(self, query=None, flower_type=None, shop=None, min_discount=None, max_discount=None):
+        where, params = _text_where(query, shop)
+        flower_type = _flower_filter(flower_type)
+        if len(where) == 1 and flower_type is None and min_discount is None and max_discount is None:
+            # Без фильтров - готовые счётчики из facet_counts, которые ведут триггеры;
+            # прочитанные держатся, пока каталог не изменится
+            version = self.data_version()
+            if self.facets is None or self.facets_version != version:
+                facets = empty_facets()
+                for field, value, n in self.conn.execute(
+                        "SELECT field, value, n FROM facet_counts WHERE n > 0 AND field != 'shop'"):
+                    facets[field][value] = n
+                facets["shop"] = dict(self.conn.execute(
+                    "SELECT value, n FROM facet_counts WHERE field = 'shop' AND n > 0 ORDER BY n DESC, value LIMIT ?",
+                    (SHOP_FACET_LIMIT,)).fetchall())
+                facets["total"] = sum(facets["flower_type"].values())
+                self.facets, self.facets_version = facets, version
+            return self.facets
+
+        # Один проход по кандидатам; группировка в Python быстрее GROUP BY с выражениями
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        groups = Counter(cursor.execute(
+            f"SELECT flower_type, shop, discount_type, discount_value FROM promocodes WHERE {' AND '.join(where)}",
+            params
+        ))
+        facets = empty_facets()
+        for (flower, shop_name, discount_type, discount_value), n in groups.items():
+            in_range = (min_discount is None or discount_value >= min_discount) and \
+                       (max_discount is None or discount_value <= max_discount)
+            in_type = flower_type is None or flower == flower_type
+            if in_range:
+                facets["flower_type"][flower] = facets["flower_type"].get(flower, 0) + n
+            if in_type:
+                bucket = discount_bucket(discount_value)
+                facets["discount"][bucket] = facets["discount"].get(bucket, 0) + n
+            if in_range and in_type:
+                facets["total"] += n
+                facets["shop"][shop_name] = facets["shop"].get(shop_name, 0) + n
+                facets["discount_type"][discount_type] = facets["discount_type"].get(discount_type, 0) + n
+        facets["shop"] = top_values(facets["shop"])
+        return facets
+
+    def suggest(self, text, limit=10, fuzzy=True):
+        if self.suggest_version is None:
+            # Первая подсказка процесса: отвечать ещё не по чему, индекс строится сразу
+            self._rebuild_suggestions()
+        elif self._suggest_version() != self.suggest_version and self.suggest_thread is None:
+            # Каталог менял другой воркер: индекс перестраивается в фоне, а до замены
+            # подсказки идут по прежнему - устаревшие на одну запись, но без паузы в запросе
+            self.suggest_thread = threading.Thread(target=self._rebuild_suggestions, name="suggest-rebuild",
+                                                   daemon=True)
+            self.suggest_thread.start()
+        return self.suggestions.suggest(text, limit, fuzzy)
+
+    def _rebuild_suggestions(self):
+        """Строит индекс подсказок по снимку базы; своё соединение, поэтому можно из другого потока"""
+        try:
+            conn = sqlite3.connect(self.path)
+            try:
+                # Версия и строки читаются в одной транзакции - из одного и того же снимка
+                conn.execute("BEGIN")
+                version = conn.execute("SELECT n FROM suggest_version").fetchone()[0]
+                suggestions = SuggestIndex()
+                for code, shop in conn.execute("SELECT code, shop FROM promocodes WHERE is_active = 1"):
+                    suggestions.add({"code": code, "shop": shop})
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+            with self.suggest_lock:
+                self.suggestions, self.suggest_version = suggestions, version
+        finally:
+            self.suggest_thread = None
+
+    def top_popular(self, limit=None, after=None):
+        return self._fetch_page(["is_active = 1"], [], "rating", after, limit)
+
+    def position(self, promo, order):
+        if order not in SQLITE_ORDERS:
+            return (promo["id"],)
+        if order in ("newest", "oldest"):
+            key = parse_created_at(promo["created_at"])
+        elif order in ("discount_high", "discount_low"):
+            key = promo["discount_value"]
+        elif order == "popular":
+            key = promo["copies"]
+        else:
+            key = popularity_score(promo)
+        return (-key if SQLITE_ORDERS[order][1] else key, promo["id"])
+
+    def _fetch_page(self, where, params, order, after, limit):
+        """SELECT с условием после позиции after в порядке order"""
+        where, params = list(where), list(params)
+        expr, descending = SQLITE_ORDERS.get(order, ("id", False))
+        if after is not None:
+            if order in SQLITE_ORDERS:
+                value = -after[0] if descending else after[0]
+                where.append(f"({expr} {'<' if descending else '>'} ? OR ({expr} = ? AND id > ?))")
+                params += [value, value, after[1]]
+            else:
+                where.append("id > ?")
+                params.append(after[0])
+
+        sql = "SELECT * FROM promocodes"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY " + ("id" if expr == "id" else f"{expr} {'DESC' if descending else 'ASC'}, id")
+        sql += " LIMIT ?"
+        params.append(-1 if limit is None else limit)
+        return self._fetch(sql, params)
+
+    # ---------- Счётчики ----------
+    def increment(self, promo_id, key, n=1):
+        if key not in STAT_KEYS:
+            return False
+        cursor = self.conn.execute(f"UPDATE promocodes SET {key} = {key} + ? WHERE id = ?", (n, promo_id))
+        return cursor.rowcount > 0
+
+    def increment_many(self, deltas):
+        deltas = [(promo_id, key, n) for promo_id, key, n in deltas if key in STAT_KEYS]
+        applied = 0
+        # Одна транзакция на пачку: один fsync журнала вместо одного на событие
+        self.conn.execute("BEGIN")
+        try:
+            for promo_id, key, n in deltas:
+                cursor = self.conn.execute(f"UPDATE promocodes SET {key} = {key} + ? WHERE id = ?", (n, promo_id))
+                applied += cursor.rowcount
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return applied
+
+    def get_stats(self, promo_id):
+        row = self.conn.execute("SELECT views, copies, clicks FROM promocodes WHERE id = ?", (promo_id,)).fetchone()
+        if row is None:
+            return {"views": 0, "copies": 0, "clicks": 0}
+        return dict(row)
+
+    def _fetch(self, sql, params=()):
+        return [_row_to_promo(row) for row in self.conn.execute(sql, params)]
+
+    # ---------- История действий ----------
+    def interactions_version(self):
+        return self.conn.execute("SELECT n FROM interactions_version").fetchone()[0]
+
+    def load_interactions(self):
+        # Своё соединение: загрузка идёт в потоке пересчёта, пока цикл событий работает с основным
+        conn = sqlite3.connect(self.path)
+        try:
+            interactions = {}
+            for username, promo_id, weight in conn.execute("SELECT username, promo_id, weight FROM interactions"):
+                interactions.setdefault(username, {})[promo_id] = weight
+            return interactions
+        finally:
+            conn.close()
+
+    def add_interactions(self, deltas):
+        self._write_interactions(lambda: self.conn.executemany(ADD_INTERACTION, deltas))
+
+    def merge_interactions(self, merged):
+        def merge():
+            for promo_id, kept in merged.items():
+                self.conn.execute(
+                    "INSERT INTO interactions (username, promo_id, weight) "
+                    "SELECT username, ?, weight FROM interactions WHERE promo_id = ? "
+                    "ON CONFLICT (username, promo_id) DO UPDATE SET weight = weight + excluded.weight",
+                    (kept, promo_id)
+                )
+                self.conn.execute("DELETE FROM interactions WHERE promo_id = ?", (promo_id,))
+        self._write_interactions(merge)
+
+    def _write_interactions(self, write):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            write()
+            self.conn.execute("UPDATE interactions_version SET n = n + 1")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+
+def _flower_filter(flower_type: Optional[str]) -> Optional[str]:
+    """Тип цветов для фильтра; "all" и пустое значение - без фильтра"""
+    return flower_type if flower_type and flower_type != "all" else None
+
+
+def _text_where(query: Optional[str], shop: Optional[str]):
+    """Условия активности, текстового поиска и магазина для SQLite"""
+    where, params = ["is_active = 1"], []
+    if query:
+        where.append("(instr(code_lc, ?) > 0 OR instr(shop_lc, ?) > 0 OR instr(description_lc, ?) > 0)")
+        params += [query.lower()] * 3
+    if shop:
+        where.append("instr(shop_lc, ?) > 0")
+        params.append(shop.lower())
+    return where, params
+
+
+def _discount_where(min_discount: Optional[int], max_discount: Optional[int]):
+    parts, params = [], []
+    if min_discount is not None:
+        parts.append("discount_value >= ?")
+        params.append(min_discount)
+    if max_discount is not None:
+        parts.append("discount_value <= ?")
+        params.append(max_discount)
+    return " AND ".join(parts), params
+
+
+def _expires_ts(expires_at: Optional[str]) -> Optional[int]:
+    """Срок истечения для столбца expires_ts; без срока или с неразборчивым - NULL"""
+    if not expires_at:
+        return None
+    try:
+        return parse_expires_at(expires_at)
+    except ValueError:
+        return None
+
+
+def _row_to_promo(row) -> dict:
+    promo = {column: row[column] for column in PROMO_COLUMNS}
+    promo["is_active"] = bool(promo["is_active"])
+    return promo
+
+
+def create_repository(backend: str, data_dir: str = "data") -> PromoRepository:
+    """Создаёт хранилище по имени драйвера: memory или sqlite"""
+    if backend == "memory":
+        return MemoryRepository(data_dir)
+    if backend == "sqlite":
+        return SQLiteRepository(os.path.join(data_dir, "promocodes.db"))
+    raise ValueError(f"Неизвестный драйвер хранилища: {backend}")
@@ -0,0 +1,39 @@
+"""Сериализация промокодов для JSON API"""
+import json
+from typing import Iterable, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # без orjson работает и стандартный json, только медленнее
+    orjson = None
+
+# Поля, которые отдаёт API (статистика берётся из счётчиков, а не из записи)
+API_FIELDS = (
+    "id", "code", "shop", "discount", "description", "usage_instructions", "flower_type",
+    "discount_type", "discount_value", "owner", "created_at", "expires_at", "is_active",
+    "emoji", "views", "copies", "clicks"
+)
+STAT_FIELDS = {"views", "copies", "clicks"}
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """Список полей из параметра fields=code,shop; ValueError для неизвестных"""
+    if not fields:
+        return API_FIELDS
+    selected = tuple(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in selected if field not in API_FIELDS]
+    if unknown:
+        raise ValueError(f"Неизвестные поля: {', '.join(unknown)}")
+    return selected or API_FIELDS
+
+
+def project(promo: dict, fields: Iterable[str], get_stats) -> dict:
+    """Только запрошенные поля промокода"""
+    stats = get_stats(promo["id"]) if STAT_FIELDS.intersection(fields) else None
+    return {field: stats[field] if field in STAT_FIELDS else promo.get(field) for field in fields}
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
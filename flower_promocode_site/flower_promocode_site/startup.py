@@ -0,0 +1,87 @@
+"""Холодный старт: замер этапов, предкомпиляция шаблонов и прогрев маршрутов"""
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable
+
+from jinja2 import Environment, FileSystemBytecodeCache
+
+
+class StartupTimer:
+    """Длительность этапов запуска для отчёта в консоли и на /metrics"""
+
+    def __init__(self):
+        self.last = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def lap(self, name: str):
+        """Этап от предыдущей отметки (или создания таймера) до текущего момента"""
+        now = time.perf_counter()
+        self.phases[name] = now - self.last
+        self.last = now
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.last = time.perf_counter()
+            self.phases[name] = self.last - started
+
+    def report(self) -> str:
+        parts = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in self.phases.items())
+        return f"Запуск за {sum(self.phases.values()):.2f} с: {parts}"
+
+
+def precompile_templates(env: Environment, cache_dir: str) -> int:
+    """Компилирует все шаблоны заранее; байткод сохраняется в cache_dir.
+
+    Следующий запуск берёт готовый байткод с диска вместо разбора и
+    компиляции. Ключ кеша - имя шаблона, в записи хранится контрольная
+    сумма исходника, так что изменённый шаблон компилируется заново.
+    Синхронному и асинхронному окружению нужны разные папки: код,
+    скомпилированный для generate_async, отличается от обычного.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    names = env.list_templates(extensions=("html",))
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+async def warm_routes(app, paths: Iterable[str]) -> Dict[str, int]:
+    """Проходит маршруты через всё приложение, как первый посетитель; путь -> код ответа.
+
+    Заполняет кеш страниц и кеши, которые строятся при первом обращении,
+    чтобы их стоимость не доставалась первым пользователям после выкладки.
+    """
+    statuses = {}
+    for url in paths:
+        path, _, query = url.partition("?")
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+            "root_path": "", "headers": [(b"host", b"localhost")], "client": None, "server": ("localhost", 80),
+        }
+        received = False
+        disconnected = asyncio.Event()
+
+        async def receive():
+            nonlocal received
+            if received:
+                # Потоковый ответ ждёт отключения клиента - до конца ответа его не будет
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses[url] = message["status"]
+
+        await app(scope, receive, send)
+        disconnected.set()
+    return statuses
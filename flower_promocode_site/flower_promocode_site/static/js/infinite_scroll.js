@@ -0,0 +1,51 @@
+// Подгрузка следующих страниц списка промокодов при прокрутке.
+// Страница отдаёт первую порцию и блок #load-more с адресом фрагмента,
+// фрагмент возвращает HTML карточек и адрес следующего в X-Next-Page.
+(function () {
+    const list = document.getElementById('promo-list');
+    const more = document.getElementById('load-more');
+    if (!list || !more) return;
+
+    // Секунд до повтора после сбоя сети или сервера, если он не прислал Retry-After
+    const RETRY_DELAY = 5;
+
+    let loading = false;
+
+    function loadNext() {
+        const url = more.dataset.next;
+        if (loading || !url) return;
+        loading = true;
+
+        fetch(url)
+            .then(response => {
+                // Тело ошибки (JSON с detail, текст 429) в список не вставляется
+                if (!response.ok) throw response;
+                more.dataset.next = response.headers.get('X-Next-Page') || '';
+                return response.text();
+            })
+            .then(html => {
+                list.insertAdjacentHTML('beforeend', html);
+                loading = false;
+                if (!more.dataset.next) {
+                    observer.disconnect();
+                    more.remove();
+                }
+            })
+            .catch(error => {
+                loading = false;
+                // Курсор остаётся прежним. 400 и 401 (устаревший курсор, выход из аккаунта)
+                // повтором не исправить - только кнопкой; 429, 5xx и сбой сети - повтор
+                const status = error instanceof Response ? error.status : 0;
+                if (status && status !== 429 && status < 500) return;
+                const wait = status ? Number(error.headers.get('Retry-After')) || RETRY_DELAY : RETRY_DELAY;
+                setTimeout(loadNext, wait * 1000);
+            });
+    }
+
+    const observer = new IntersectionObserver(entries => {
+        if (entries[0].isIntersecting) loadNext();
+    }, { rootMargin: '400px' });
+
+    observer.observe(more);
+    more.querySelector('button').addEventListener('click', loadNext);
+})();
@@ -0,0 +1,44 @@
+// Автодополнение полей поиска подсказками из /search/suggest.
+// Поле с data-suggest="all" получает коды и магазины, "shop" - только магазины;
+// варианты попадают в <datalist>, указанный в атрибуте list поля.
+(function () {
+    const SUGGEST_DELAY = 150;
+    const SUGGEST_LIMIT = 8;
+
+    document.querySelectorAll('input[data-suggest]').forEach(input => {
+        const list = document.getElementById(input.getAttribute('list'));
+        if (!list) return;
+
+        let timer = null;
+        let controller = null;
+
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            const text = input.value.trim();
+            if (text.length < 2) {
+                list.innerHTML = '';
+                return;
+            }
+            // Запрос уходит после паузы в наборе; незавершённый предыдущий отменяется
+            timer = setTimeout(() => {
+                if (controller) controller.abort();
+                controller = new AbortController();
+                const params = new URLSearchParams({ q: text, limit: SUGGEST_LIMIT });
+                fetch(`/search/suggest?${params}`, { signal: controller.signal })
+                    .then(response => response.json())
+                    .then(items => {
+                        list.innerHTML = '';
+                        items
+                            .filter(item => input.dataset.suggest === 'all' || item.kind === input.dataset.suggest)
+                            .forEach(item => {
+                                const option = document.createElement('option');
+                                option.value = item.text;
+                                option.label = item.kind === 'shop' ? `магазин · ${item.count}` : 'код';
+                                list.appendChild(option);
+                            });
+                    })
+                    .catch(() => {});
+            }, SUGGEST_DELAY);
+        });
+    });
+})();
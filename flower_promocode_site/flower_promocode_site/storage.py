@@ -0,0 +1,244 @@
+"""Долговременное хранилище: журнал упреждающей записи (WAL) и снимки в data/"""
+import json
+import os
+import queue
+import threading
+
+# Маркер остановки фонового потока записи
+_STOP = object()
+
+
+class Storage:
+    """Журнал изменений с периодическими сжатыми снимками.
+
+    Каждое изменение дописывается строкой JSON в data/wal.log фоновым
+    потоком, поэтому обработчики запросов не ждут диска. Снимок пишется
+    в data/users.json и data/promocodes.json вместе с номером последней
+    вошедшей в него записи, после чего журнал обрезается. При запуске
+    состояние собирается из снимков и хвоста журнала.
+    """
+
+    def __init__(self, data_dir: str = "data", compact_every: int = 100_000, fsync: bool = False):
+        self.data_dir = data_dir
+        self.log_path = os.path.join(data_dir, "wal.log")
+        self.users_path = os.path.join(data_dir, "users.json")
+        self.promocodes_path = os.path.join(data_dir, "promocodes.json")
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.seq = 0
+        self.records_since_snapshot = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+
+    # ---------- Загрузка ----------
+    def load(self) -> dict:
+        """Восстанавливает состояние из последнего снимка и хвоста журнала"""
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        users, users_seq = {}, 0
+        data = _read_json(self.users_path, {})
+        if isinstance(data, dict) and "seq" in data and "users" in data:
+            users, users_seq = data["users"], data["seq"]
+        elif isinstance(data, dict):
+            users = data
+
+        promocodes, popularity_stats, next_promo_id, promos_seq = [], {}, 1, 0
+        data = _read_json(self.promocodes_path, [])
+        if isinstance(data, dict):
+            promocodes = data["promocodes"]
+            popularity_stats = {int(k): v for k, v in data["popularity_stats"].items()}
+            next_promo_id = data["next_promo_id"]
+            promos_seq = data["seq"]
+        else:
+            promocodes = data
+            for promo in promocodes:
+                popularity_stats[promo["id"]] = _initial_stats(promo)
+                next_promo_id = max(next_promo_id, promo["id"] + 1)
+
+        state = {
+            "users": users,
+            "promocodes": promocodes,
+            "popularity_stats": popularity_stats,
+            "next_promo_id": next_promo_id,
+        }
+        self.seq = max(users_seq, promos_seq)
+
+        by_id = {p["id"]: p for p in promocodes}
+        replayed = 0
+        if os.path.exists(self.log_path):
+            good = 0  # байт от начала журнала до конца последней целой записи
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Оборванная при сбое последняя строка
+                        break
+                    good += len(line)
+                    seq = record["seq"]
+                    self.seq = max(self.seq, seq)
+                    replayed += 1
+                    if record["op"] == "register":
+                        if seq > users_seq:
+                            users[record["username"]] = record["password"]
+                    elif seq > promos_seq:
+                        _apply_promo_record(state, by_id, record)
+            _repair_log(self.log_path, good)
+
+        if len(by_id) != len(state["promocodes"]):
+            # Удалённые промокоды убираем из списка одним проходом
+            state["promocodes"] = [p for p in state["promocodes"] if p["id"] in by_id]
+        self.records_since_snapshot = replayed
+        return state
+
+    # ---------- Запись ----------
+    def start(self):
+        """Запускает фоновый поток записи журнала"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._writer, name="wal-writer", daemon=True)
+            self._thread.start()
+
+    def append(self, op: str, **fields):
+        """Ставит изменение в очередь на запись, не блокируя цикл событий"""
+        self.seq += 1
+        self.records_since_snapshot += 1
+        fields["seq"] = self.seq
+        fields["op"] = op
+        self._queue.put(json.dumps(fields, ensure_ascii=False) + "\n")
+
+    def snapshot(self, state: dict):
+        """Записывает снимок состояния и обрезает журнал.
+
+        state должен быть копией, снятой в потоке цикла событий: номер
+        записи фиксируется здесь же, поэтому снимок ровно покрывает
+        всё, что уже поставлено в очередь.
+        """
+        self.records_since_snapshot = 0
+        self._queue.put((self.seq, state))
+
+    def maybe_snapshot(self, capture) -> bool:
+        """Снимает снимок, если в журнале накопилось compact_every записей"""
+        if self.records_since_snapshot < self.compact_every:
+            return False
+        self.snapshot(capture())
+        return True
+
+    def close(self):
+        """Дописывает очередь и останавливает поток записи"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _writer(self):
+        log = open(self.log_path, "a", encoding="utf-8")
+        try:
+            while True:
+                batch = [self._queue.get()]
+                try:
+                    while len(batch) < 10_000:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    pass
+
+                lines = []
+                stop = False
+                for item in batch:
+                    if item is _STOP:
+                        stop = True
+                        break
+                    if isinstance(item, str):
+                        lines.append(item)
+                        continue
+                    # Снимок: сначала дописываем всё, что было до него
+                    self._write_lines(log, lines)
+                    lines = []
+                    self._write_snapshot(*item)
+                    log.close()
+                    log = open(self.log_path, "w", encoding="utf-8")
+                self._write_lines(log, lines)
+                if stop:
+                    return
+        finally:
+            log.close()
+
+    def _write_lines(self, log, lines):
+        if not lines:
+            return
+        log.writelines(lines)
+        log.flush()
+        if self.fsync:
+            os.fsync(log.fileno())
+
+    def _write_snapshot(self, seq: int, state: dict):
+        _write_json_atomic(self.users_path, {"seq": seq, "users": state["users"]})
+        _write_json_atomic(self.promocodes_path, {
+            "seq": seq,
+            "next_promo_id": state["next_promo_id"],
+            "popularity_stats": state["popularity_stats"],
+            "promocodes": state["promocodes"],
+        })
+
+
+def _initial_stats(promo: dict) -> dict:
+    return {"views": promo.get("views", 0), "copies": promo.get("copies", 0), "clicks": promo.get("clicks", 0)}
+
+
+def _apply_promo_record(state: dict, by_id: dict, record: dict):
+    """Применяет запись журнала о промокоде к восстанавливаемому состоянию"""
+    op = record["op"]
+    if op == "add_promo":
+        promo = record["promo"]
+        state["promocodes"].append(promo)
+        by_id[promo["id"]] = promo
+        state["popularity_stats"][promo["id"]] = _initial_stats(promo)
+        state["next_promo_id"] = max(state["next_promo_id"], promo["id"] + 1)
+    elif op == "edit_promo":
+        promo = by_id.get(record["id"])
+        if promo is not None:
+            promo.update(record["fields"])
+    elif op == "delete_promo":
+        by_id.pop(record["id"], None)
+        state["popularity_stats"].pop(record["id"], None)
+    elif op == "track":
+        stats = state["popularity_stats"].get(record["id"])
+        if stats is not None:
+            stats[record["key"]] += record["n"]
+
+
+def _repair_log(path: str, good: int):
+    """Отрезает от журнала оборванный хвост после последней целой записи.
+
+    Иначе новые записи дописались бы вплотную к обрывку, и следующий
+    запуск остановился бы на нём же, потеряв всё записанное после сбоя.
+    Целая запись без перевода строки (сбой между ними) дополняется им.
+    """
+    with open(path, "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(good - 1, 0))
+        newline = good == 0 or f.read(1) == b"\n"
+        if size == good and newline:
+            return
+        f.truncate(good)
+        if not newline:
+            f.seek(good)
+            f.write(b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_json(path: str, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    return json.loads(content) if content else default
+
+
+def _write_json_atomic(path: str, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
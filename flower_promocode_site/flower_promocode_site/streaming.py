@@ -0,0 +1,34 @@
+"""Потоковый рендеринг шаблонов порциями"""
+from typing import AsyncIterator
+
+from jinja2 import Template
+
+# Метка в шаблоне: всё до неё отправляется сразу (шапка и навигация)
+FLUSH_MARKER = "<!--flush-->"
+# Размер порции, после которого накопленный HTML уходит клиенту
+CHUNK_SIZE = 16 * 1024
+
+
+async def render_chunks(template: Template, context: dict, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[str]:
+    """Рендерит шаблон через generate_async и отдаёт HTML порциями.
+
+    Jinja выдаёт страницу мелкими кусками; они копятся до chunk_size
+    или до метки FLUSH_MARKER (сама метка из вывода убирается), поэтому
+    в памяти одновременно лежит не больше одной порции страницы.
+    """
+    buffer = []
+    size = 0
+    async for piece in template.generate_async(context):
+        if FLUSH_MARKER in piece:
+            *parts, piece = piece.split(FLUSH_MARKER)
+            buffer.extend(parts)
+            if any(buffer):
+                yield "".join(buffer)
+            buffer, size = [], 0
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
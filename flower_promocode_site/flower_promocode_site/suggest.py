@@ -0,0 +1,256 @@
+"""Подсказки поиска: автодополнение по началу и поиск с опечатками по кодам и магазинам"""
+import heapq
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Set, Tuple
+
+from promos import normalize_text
+
+# Сколько ключей с нужным началом просматривается для выбора самых частых
+PREFIX_SCAN_LIMIT = 1000
+# Допустимое число опечаток: до 5 символов - одна, длиннее - две
+SHORT_QUERY = 5
+# Сколько начал ключей проверяется расстоянием Левенштейна за один поиск с опечатками
+FUZZY_CANDIDATES = 200
+
+
+def term_keys(kind: str, text: str) -> Set[str]:
+    """Ключи, по которым находится подсказка.
+
+    Код ищется целиком без разделителей (SPRING-30 и spring30 - одно и
+    то же), магазин - по всему названию и по каждому слову, чтобы
+    "delivery" находило "Flower Delivery".
+    """
+    name = normalize_text(text)
+    if kind == "code":
+        return {name.replace(" ", "")} if name else set()
+    return {name, *name.split()} if name else set()
+
+
+def prefix_grams(text: str) -> Set[str]:
+    """Триграммы строки с меткой начала: "ab" -> {"$$a", "$ab"}"""
+    padded = "$$" + text
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def prefix_distance(query: str, key: str, limit: int) -> int:
+    """Расстояние Левенштейна от query до ближайшего начала key.
+
+    Считается построчно по символам query; как только вся строка
+    превышает limit, дальше считать бесполезно - возвращается limit + 1.
+    Правки в середине ключа учитываются, хвост ключа после совпавшего
+    начала бесплатен.
+    """
+    # Считается только полоса |i - j| <= limit: клетки вне неё заведомо дальше limit
+    key = key[:len(query) + limit]
+    worse = limit + 1
+    previous = [j if j <= limit else worse for j in range(len(key) + 1)]
+    for i, char in enumerate(query, 1):
+        low = max(1, i - limit)
+        high = min(len(key), i + limit)
+        current = [worse] * (len(key) + 1)
+        current[0] = i if i <= limit else worse
+        for j in range(low, high + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != key[j - 1]))
+        if min(current) > limit:
+            return worse
+        previous = current
+    return min(previous)
+
+
+def max_typos(query: str) -> int:
+    """Опечаток не больше, чем позволяет фильтр по триграммам (нужна хотя бы одна общая)"""
+    allowed = 1 if len(query) <= SHORT_QUERY else 2
+    return max(0, min(allowed, (len(prefix_grams(query)) - 1) // 3))
+
+
+class SuggestIndex:
+    """Индекс подсказок по кодам и магазинам активных промокодов.
+
+    Ключи (нормализованные коды, названия магазинов и их слова) лежат в
+    отсортированном списке: все ключи с одним началом идут подряд и
+    находятся двумя bisect, как в префиксном дереве, но без узла на
+    каждый символ. Для опечаток по ключам строится индекс триграмм:
+    строка с d опечатками сохраняет не меньше |триграмм| - 3d общих
+    триграмм с ключом, поэтому расстояние Левенштейна считается только
+    для кандидатов, прошедших этот порог, а не для всего каталога.
+
+    Расстояние зависит лишь от начала ключа длиной len(query) + d, поэтому
+    кандидаты - начала, а не ключи: тысячи кодов SPRING... проверяются
+    одним вычислением, а число проверяемых начал ограничено
+    FUZZY_CANDIDATES. Триграммы начала ("$$s", "$sp") есть почти у всех
+    ключей на эту букву, поэтому по их спискам не считается: ключи с
+    теми же первыми буквами лежат подряд в отсортированном списке, и
+    их разные начала перебираются прыжками bisect.
+    """
+
+    def __init__(self):
+        self.terms: Dict[Tuple[str, str], list] = {}  # (вид, нормализованный текст) -> [текст, число промокодов]
+        self.keys: List[str] = []  # по возрастанию, если sorted
+        self.sorted = True
+        self.key_terms: Dict[str, Set[Tuple[str, str]]] = {}  # ключ -> термины
+        self.grams: Dict[str, Set[str]] = {}  # триграмма -> ключи
+
+    def add(self, promo: dict):
+        for kind in ("code", "shop"):
+            self._add_term(kind, promo.get(kind) or "")
+
+    def remove(self, promo: dict):
+        for kind in ("code", "shop"):
+            self._remove_term(kind, promo.get(kind) or "")
+
+    def _add_term(self, kind: str, text: str):
+        keys = term_keys(kind, text)
+        if not keys:
+            return
+        term = (kind, normalize_text(text))
+        entry = self.terms.get(term)
+        if entry is not None:
+            entry[0] = text
+            entry[1] += 1
+            return
+        self.terms[term] = [text, 1]
+        for key in keys:
+            terms = self.key_terms.get(key)
+            if terms is None:
+                terms = self.key_terms[key] = set()
+                # Новые ключи дописываются в конец, сортировка - перед первым чтением:
+                # при загрузке каталога это одна сортировка вместо insort на каждый ключ
+                self.keys.append(key)
+                self.sorted = False
+                for gram in prefix_grams(key):
+                    self.grams.setdefault(gram, set()).add(key)
+            terms.add(term)
+
+    def _remove_term(self, kind: str, text: str):
+        term = (kind, normalize_text(text))
+        entry = self.terms.get(term)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del self.terms[term]
+        self._sort_keys()
+        for key in term_keys(kind, text):
+            terms = self.key_terms[key]
+            terms.discard(term)
+            if terms:
+                continue
+            del self.key_terms[key]
+            del self.keys[bisect_left(self.keys, key)]
+            for gram in prefix_grams(key):
+                keys_with_gram = self.grams[gram]
+                keys_with_gram.discard(key)
+                if not keys_with_gram:
+                    del self.grams[gram]
+
+    def suggest(self, text: str, limit: int = 10, fuzzy: bool = True) -> List[dict]:
+        """Подсказки по началу ключа; если их меньше limit - добираются с опечатками"""
+        query = normalize_text(text)
+        if not query:
+            return []
+        found = self.complete(query, limit)
+        if fuzzy and len(found) < limit:
+            seen = {(item["kind"], item["text"]) for item in found}
+            found += [item for item in self.fuzzy(query, limit)
+                      if (item["kind"], item["text"]) not in seen][:limit - len(found)]
+        return found
+
+    def complete(self, query: str, limit: int = 10) -> List[dict]:
+        """Самые частые термины, ключ которых начинается с query"""
+        # Ключи кодов без пробелов: "spring 30" должно находить SPRING30
+        return [self._item(term, 0) for term in self._prefix_terms({query, query.replace(" ", "")}, limit)]
+
+    def _prefix_terms(self, prefixes: Iterable[str], limit: int) -> List[Tuple[str, str]]:
+        self._sort_keys()
+        keys = self.keys
+        terms = set()
+        for prefix in prefixes:
+            start = bisect_left(keys, prefix)
+            for key in keys[start:start + PREFIX_SCAN_LIMIT]:
+                if not key.startswith(prefix):
+                    break
+                terms |= self.key_terms[key]
+        return sorted(terms, key=lambda term: (-self.terms[term][1], len(term[1]), term))[:limit]
+
+    def fuzzy(self, query: str, limit: int = 10) -> List[dict]:
+        """Термины, начало ключа которых отличается от query не больше чем на max_typos правок.
+
+        Сначала ищется с одной опечаткой (фильтр триграмм строже, кандидатов
+        меньше); вторая допускается, только если подсказок не хватило -
+        первые limit в порядке (опечатки, частота) от этого не меняются.
+        """
+        query = normalize_text(query)
+        found = []
+        for typos in range(1, max_typos(query) + 1):
+            found = self._within(query, typos, limit)
+            if len(found) >= limit:
+                break
+        return found
+
+    def _within(self, query: str, typos: int, limit: int) -> List[dict]:
+        grams = prefix_grams(query)
+        needed = len(grams) - 3 * typos
+        if needed < 1:
+            return []
+
+        # Общие триграммы начала не считаются, поэтому порог на две ниже
+        shared = Counter()
+        for gram in grams:
+            if not gram.startswith("$"):
+                shared.update(self.grams.get(gram, ()))
+        needed_inner = max(1, needed - 2)
+
+        # Начало ключа -> число ключей и наибольшее число общих триграмм
+        length = len(query) + typos
+        shortest = len(query) - typos
+        heads = Counter()
+        heads_shared = {}
+        for key, count in shared.most_common():
+            if count < needed_inner:
+                break
+            head = key[:length]
+            if len(head) >= shortest:
+                heads[head] += 1
+                heads_shared.setdefault(head, count)
+        # Ключи, у которых общие с query только первые буквы
+        if needed <= 2:
+            for head, count in self._heads(query[:2] if needed == 2 else query[:1], length):
+                if len(head) >= shortest and head not in heads:
+                    heads[head] = count
+                    heads_shared[head] = 0
+        candidates = heapq.nlargest(FUZZY_CANDIDATES, heads, key=lambda head: (heads_shared[head], heads[head]))
+
+        best = {}  # термин -> расстояние
+        for head in candidates:
+            distance = prefix_distance(query, head, typos)
+            if distance > typos:
+                continue
+            for term in self._prefix_terms((head,), limit):
+                if distance < best.get(term, typos + 1):
+                    best[term] = distance
+        ranked = sorted(best.items(), key=lambda item: (item[1], -self.terms[item[0]][1], item[0]))
+        return [self._item(term, distance) for term, distance in ranked[:limit]]
+
+    def _heads(self, prefix: str, length: int):
+        """(начало длиной length, число ключей с ним) для ключей, начинающихся с prefix"""
+        self._sort_keys()
+        keys = self.keys
+        start = bisect_left(keys, prefix)
+        for _ in range(FUZZY_CANDIDATES):
+            if start == len(keys) or not keys[start].startswith(prefix):
+                return
+            head = keys[start][:length]
+            end = bisect_left(keys, head + "\U0010ffff", start)
+            yield head, end - start
+            start = end
+
+    def _sort_keys(self):
+        if not self.sorted:
+            self.keys.sort()
+            self.sorted = True
+
+    def _item(self, term: Tuple[str, str], distance: int) -> dict:
+        text, count = self.terms[term]
+        return {"kind": term[0], "text": text, "count": count, "typos": distance}